@@ -11,22 +11,46 @@
 # ============================================================= #
 
 """
-CalcLab requires the following modules, however, the program will install them
-automatically. Should the program fail to do so, please install them manually
-through the terminal with the following commands.
-1. pip install forex-python
-2. pip install numpy
-3. pip install requests
+CalcLab requires the following modules. They are only imported when a page
+first needs them, and CalcLab will tell you which one is missing. Please
+install them through the terminal with the following commands.
+1. pip install numpy
+2. pip install requests
 """
 
+import argparse
+import ast
+import atexit
+import concurrent.futures
+import csv
+import functools
+import gzip
+import heapq
+import importlib
+import importlib.util
+import itertools
+import json
 import math
+import multiprocessing
+import operator
 import os
 import random
+import re
 import subprocess
+import sqlite3
 import sys
+import threading
 import turtle as t
 from abc import ABC, abstractmethod
-from datetime import datetime
+from datetime import datetime, timedelta
+from multiprocessing import shared_memory
+from time import monotonic, perf_counter, sleep
+
+"""Memory limits for calculation workers are only available on POSIX"""
+try:
+    import resource
+except ImportError:
+    resource = None
 
 """Determine which tkinter version to use"""
 try:
@@ -36,42 +60,43 @@ except ImportError:
     import Tkinter as tk  # python 2
     from Tkinter import messagebox
 
-"""Check for forex-python module"""
-try:
-    from forex_python.converter import (CurrencyRates, RatesNotAvailableError,
-                                        DecimalFloatMismatchError)
-    from forex_python.bitcoin import BtcConverter
-except ImportError:
-    print("> 'forex-python' module is missing!\n" +
-          "Trying to install required module: forex-python")
-    subprocess.check_call([sys.executable, "-m", "pip", "install",
-                          "forex-python"])
-    print()
-finally:
-    from forex_python.converter import CurrencyRates, RatesNotAvailableError
-    from forex_python.bitcoin import BtcConverter
-
-"""Check for numpy module"""
-try:
-    import numpy
-except ImportError:
-    print("> 'numpy' module is missing!\n" +
-          "Trying to install required module: numpy")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "numpy"])
-    print()
-finally:
-    import numpy
-
-"""Check for requests module"""
-try:
-    import requests
-except ImportError:
-    print("> 'requests' module is missing!\n" +
-          "Trying to install required module: requests")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "requests"])
-    print()
-finally:
-    import requests
+"""
+Optional modules (import name -> pip package). They are imported on first
+use through LazyModule, so startup never waits for them, and
+missing_modules() checks whether they are installed without importing them.
+"""
+optionalModules = {"numpy": "numpy", "requests": "requests"}
+
+
+def missing_modules(*names):
+    """Return the pip packages of the given optional modules which are not installed."""
+    return [optionalModules[name] for name in names if importlib.util.find_spec(name) is None]
+
+
+class LazyModule:
+    """
+    Stand-in for a module which is imported the first time one of its
+    attributes is used. Raises ImportError naming the pip package to
+    install if the module is missing.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attribute):
+        if self.__module is None:
+            try:
+                self.__module = importlib.import_module(self.__name)
+            except ImportError as error:
+                package = optionalModules[self.__name.split(".")[0]]
+                raise ImportError(f"the '{package}' module is missing, install it with: "
+                                  f"pip install {package}") from error
+        return getattr(self.__module, attribute)
+
+
+numpy = LazyModule("numpy")
+requests = LazyModule("requests")
 
 """
 This list stores all the pages in the program, respectively. To add
@@ -247,47 +272,2326 @@ angle = {"Degrees": 1,
          "Radians": 57.29578,
          "Gradians": 0.9}
 
+"""
+This dictionary maps each category name to its conversion units, for
+converting values without going through a converter page.
+"""
+unitCategories = {"volume": volume, "length": length, "weightMass": weightMass, "energy": energy, "area": area,
+                  "speed": speed, "time": time, "power": power, "data": data, "pressure": pressure,
+                  "angle": angle}
+
+"""
+Temperature cannot be converted with factors, so every pair of units has
+its own formula, used by TemperatureConverter and the batch conversions
+alike. Temperatures below absolute zero (under 0 once converted to
+Kelvin) are errors everywhere. They work on single values as well as
+NumPy arrays.
+"""
+temperatureFormulas = {("Celsius", "Celsius"): lambda value: value + 0.0,
+                       ("Celsius", "Fahrenheit"): lambda value: (value * 9 / 5) + 32,
+                       ("Celsius", "Kelvin"): lambda value: value + 273.15,
+                       ("Fahrenheit", "Celsius"): lambda value: (value - 32) * 5 / 9,
+                       ("Fahrenheit", "Fahrenheit"): lambda value: value + 0.0,
+                       ("Fahrenheit", "Kelvin"): lambda value: ((value - 32) * 5 / 9) + 273.15,
+                       ("Kelvin", "Celsius"): lambda value: value - 273.15,
+                       ("Kelvin", "Fahrenheit"): lambda value: (value - 273.15) * (9 / 5) + 32,
+                       ("Kelvin", "Kelvin"): lambda value: value + 0.0}
+
+
+class ConversionMatrix:
+    """
+    All-pairs conversion factors of one unit category, compiled once into
+    a dense N x N matrix where factors[i, j] converts unit i into unit j,
+    plus a unit name -> index map.
+    """
+
+    def __init__(self, units):
+        self.units = list(units.keys())
+        self.index = {unit: i for i, unit in enumerate(self.units)}
+        column = numpy.array(list(units.values()), dtype=numpy.float64)
+        self.factors = column[:, numpy.newaxis] / column[numpy.newaxis, :]
+        self.rows = self.factors.tolist()  # plain floats for the single-value path
+
+    def factor(self, fromUnit, toUnit):
+        return self.rows[self.index[fromUnit]][self.index[toUnit]]
+
+    def convert(self, value, fromUnit, toUnit):
+        return value * self.rows[self.index[fromUnit]][self.index[toUnit]]
+
+    def convert_all(self, values, fromUnit):
+        """
+        Convert to every unit at once. A single value gives one result per
+        unit (in the order of units); an array of values gives a matrix
+        with one row per value.
+        """
+        row = self.factors[self.index[fromUnit]]
+        if numpy.ndim(values) == 0:
+            return row * values
+        return numpy.multiply.outer(values, row)
+
+    def convert_indexed(self, values, fromIndex, toIndex, out=None):
+        """
+        Convert values whose units vary per element, given as arrays of
+        unit indexes, by gathering their factors from the matrix.
+        """
+        return numpy.multiply(values, self.factors[fromIndex, toIndex], out=out)
+
+
+class ConversionMatrices(dict):
+    """Conversion matrices by category, compiled the first time each category is used."""
+
+    def __missing__(self, category):
+        matrix = self[category] = ConversionMatrix(unitCategories[category])
+        return matrix
+
+
+conversionMatrices = ConversionMatrices()
+
+
+def convert(values, fromUnit, toUnit, category, out=None):
+    """
+    Convert many values at once with a single vectorized multiply against
+    the conversion factor ratio. values can be a NumPy array or any
+    buffer-protocol object (i.e. array.array, memoryview), category is a
+    name from unitCategories or a unit dictionary. Pass an array or
+    writable buffer as out to write the results there instead of
+    allocating a new array; it may be values itself. The "temperature"
+    category uses temperatureFormulas instead of a factor.
+    """
+    if category == "temperature":
+        result = temperatureFormulas[fromUnit, toUnit](numpy.asarray(values, dtype=numpy.float64))
+        if out is None:
+            return result
+        out = numpy.asarray(out)
+        out[...] = result
+        return out
+    if isinstance(category, str):
+        ratio = conversionMatrices[category].factor(fromUnit, toUnit)
+    else:
+        ratio = category[fromUnit] / category[toUnit]
+    if out is not None:
+        out = numpy.asarray(out)
+    return numpy.multiply(numpy.asarray(values), ratio, out=out)
+
+
+def benchmark_conversion_matrices(number=100000, size=10 ** 6):
+    """
+    Microbenchmark of the conversion matrices against the dictionary
+    lookups the converters used to do, for single conversions, converting
+    to every unit at once, and batches with per-element units.
+    """
+    import timeit
+    units = length
+    matrix = conversionMatrices["length"]
+    names = matrix.units
+    results = []
+
+    def dict_convert(value, fromUnit, toUnit):
+        return value * units[fromUnit] / units[toUnit]
+
+    dictTime = timeit.timeit(lambda: dict_convert(12.5, "Miles", "Inches"), number=number)
+    matrixTime = timeit.timeit(lambda: matrix.convert(12.5, "Miles", "Inches"), number=number)
+    results.append(("single conversion", dictTime / number, matrixTime / number))
+
+    dictTime = timeit.timeit(lambda: [dict_convert(12.5, "Miles", name) for name in names], number=number)
+    matrixTime = timeit.timeit(lambda: matrix.convert_all(12.5, "Miles"), number=number)
+    results.append(("convert to every unit", dictTime / number, matrixTime / number))
+
+    generator = numpy.random.default_rng(0)
+    values = generator.random(size)
+    fromIndex = generator.integers(len(names), size=size)
+    toIndex = generator.integers(len(names), size=size)
+    fromNames = [names[i] for i in fromIndex]
+    toNames = [names[i] for i in toIndex]
+    dictTime = timeit.timeit(lambda: [value * units[fromName] / units[toName] for value, fromName, toName in
+                                      zip(values.tolist(), fromNames, toNames)], number=1)
+    matrixTime = timeit.timeit(lambda: matrix.convert_indexed(values, fromIndex, toIndex), number=1)
+    results.append((f"batch of {size:,} mixed units", dictTime, matrixTime))
+
+    print(f"{'benchmark':<32}{'dict':>14}{'matrix':>14}{'speedup':>10}")
+    for name, dictTime, matrixTime in results:
+        print(f"{name:<32}{dictTime * 1e6:>12.3f}us{matrixTime * 1e6:>12.3f}us{dictTime / matrixTime:>9.1f}x")
+    return results
+
+
+"""
+Categories whose converter pages accept negative values. Negative values
+in the other categories are invalid (the converters show an error).
+"""
+signedCategories = ["power", "angle", "temperature"]
+
+
+class SharedArray:
+    """
+    A float64 NumPy array (.array) in a multiprocessing.shared_memory
+    block. parallel_convert converts it in place without any copies, so
+    data that is produced straight into one skips the copy in and out.
+    """
+
+    def __init__(self, shape):
+        size = int(numpy.prod(shape)) * numpy.dtype(numpy.float64).itemsize
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.array = numpy.ndarray(shape, dtype=numpy.float64, buffer=self.memory.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        del self.array
+        self.memory.close()
+        self.memory.unlink()
+
+
+def parallel_convert(values, fromUnit, toUnit, category, out=None, processes=None, pool=None, clamp=None):
+    """
+    Convert a large array on every core. The values are placed in a
+    SharedArray which the workers convert in place chunk by chunk, so no
+    data is pickled; a SharedArray passed as values is converted in place
+    without copying. Invalid values (negative values in unsigned
+    categories, temperatures below absolute zero) become NaN, and
+    clamp=(low, high) clips the results. Pass a multiprocessing pool to
+    reuse it between calls. Returns out, or the converted array.
+    """
+    shared = values if isinstance(values, SharedArray) else None
+    if shared is None:
+        values = numpy.asarray(values, dtype=numpy.float64)
+        shared = SharedArray(values.shape)
+        shared.array[...] = values
+    processes = processes or (pool._processes if pool is not None else os.cpu_count() or 1)
+    ownPool = pool is None
+    try:
+        if ownPool:
+            pool = multiprocessing.get_context().Pool(processes)
+        size = shared.array.size
+        chunkSize = max(-(-size // processes), 1)
+        tasks = [(shared.memory.name, size, start, min(start + chunkSize, size), fromUnit, toUnit, category, clamp)
+                 for start in range(0, size, chunkSize)]
+        pool.starmap(convert_shared_chunk, tasks)
+        if shared is values:
+            if out is None:
+                return shared.array
+            out[...] = shared.array
+        else:
+            out = shared.array.copy() if out is None else out
+            if out is not shared.array:
+                out[...] = shared.array
+    finally:
+        if ownPool and pool is not None:
+            pool.close()
+            pool.join()
+        if shared is not values:
+            shared.close()
+    return out
+
+
+def convert_shared_chunk(name, size, start, stop, fromUnit, toUnit, category, clamp):
+    """Worker for parallel_convert: convert values[start:stop] of a shared memory block in place."""
+    try:
+        memory = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 attaching registers the block again with the
+        # resource tracker that pool workers share with parallel_convert,
+        # which is harmless since the tracker keeps a set of names
+        memory = shared_memory.SharedMemory(name=name)
+    try:
+        values = numpy.ndarray((size,), dtype=numpy.float64, buffer=memory.buf)[start:stop]
+        invalid = None
+        if category == "temperature":
+            invalid = temperatureFormulas[fromUnit, "Kelvin"](values) < 0
+        elif category not in signedCategories:
+            invalid = values < 0
+        convert(values, fromUnit, toUnit, category, out=values)
+        if invalid is not None:
+            values[invalid] = numpy.nan
+        if clamp is not None:
+            numpy.clip(values, *clamp, out=values)
+        del values
+    finally:
+        memory.close()
+
+
+def benchmark_parallel_conversion(size=2 * 10 ** 7):
+    """
+    Scaling curve of parallel_convert (convert, validate and clamp) from
+    one process up to the number of cores, on a SharedArray (no copies)
+    and on a plain array (copied in and out of shared memory), against
+    the same work done single-threaded in this process.
+    """
+    values = numpy.random.default_rng(0).random(size) * 1000 - 10
+    out = numpy.empty_like(values)
+
+    start = perf_counter()
+    invalid = values < 0
+    convert(values, "Meters", "Feet", "length", out=out)
+    out[invalid] = numpy.nan
+    numpy.clip(out, 0, 3000, out=out)
+    baseline = perf_counter() - start
+
+    print(f"{'processes':<12}{'shared':>10}{'speedup':>10}{'copied':>10}{'speedup':>10}")
+    print(f"{'in-process':<12}{baseline:>9.3f}s{1:>9.2f}x")
+    results = []
+    with SharedArray(values.shape) as shared:
+        for processes in range(1, (os.cpu_count() or 1) + 1):
+            with multiprocessing.get_context().Pool(processes) as pool:
+                pool.starmap(abs, [(0,)] * processes)  # start the workers
+                shared.array[...] = values
+                start = perf_counter()
+                parallel_convert(shared, "Meters", "Feet", "length", pool=pool, clamp=(0, 3000))
+                sharedTime = perf_counter() - start
+                start = perf_counter()
+                parallel_convert(values, "Meters", "Feet", "length", out=out, pool=pool, clamp=(0, 3000))
+                copiedTime = perf_counter() - start
+            results.append((processes, sharedTime, copiedTime))
+            print(f"{processes:<12}{sharedTime:>9.3f}s{baseline / sharedTime:>9.2f}x"
+                  f"{copiedTime:>9.3f}s{baseline / copiedTime:>9.2f}x")
+    return baseline, results
+
+
+def convert_csv(input, output, category, fromUnit, toUnit, columns=(0,), delimiter=",", header=False,
+                chunkSize=65536):
+    """
+    Stream a delimited file from input to output (open text files),
+    converting the given columns (0-based indexes, or names if header is
+    True) chunkSize rows at a time, so memory use stays flat whatever the
+    size of the file. Cells that are not numbers are copied unchanged;
+    temperatures below absolute zero are written as "Error". Returns the
+    number of data rows written.
+    """
+    if category != "temperature":
+        conversionMatrices[category].factor(fromUnit, toUnit)  # fail early on unknown units
+    else:
+        temperatureFormulas[fromUnit, toUnit]
+    for column in columns:
+        if isinstance(column, str) and not header:
+            raise ValueError(f"column {column!r} is a name, which needs a header")
+        if isinstance(column, int) and column < 0:
+            raise ValueError(f"column {column} is not a column index")
+    reader = csv.reader(input, delimiter=delimiter)
+    writer = csv.writer(output, delimiter=delimiter, lineterminator="\n")
+    if header:
+        names = next(reader, [])
+        for column in columns:
+            if isinstance(column, str) and column not in names:
+                raise ValueError(f"there is no column named {column!r}")
+        columns = [names.index(column) if isinstance(column, str) else column for column in columns]
+        writer.writerow(names)
+    rowCount = 0
+    while True:
+        rows = list(itertools.islice(reader, chunkSize))
+        if not rows:
+            return rowCount
+        for column in columns:
+            convert_csv_column(rows, column, category, fromUnit, toUnit)
+        writer.writerows(rows)
+        rowCount += len(rows)
+
+
+def convert_csv_column(rows, column, category, fromUnit, toUnit):
+    """Convert one column of a chunk of CSV rows in place."""
+    cells = [row[column] if column < len(row) else "" for row in rows]
+    try:
+        values = numpy.array(cells, dtype=numpy.float64)  # parsed in C
+        valid = None
+    except ValueError:
+        values = numpy.full(len(cells), numpy.nan)
+        for i, cell in enumerate(cells):
+            try:
+                values[i] = float(cell)
+            except ValueError:
+                pass
+        valid = ~numpy.isnan(values)
+    if category == "temperature":
+        tooCold = (temperatureFormulas[fromUnit, "Kelvin"](values) < 0).tolist()
+    results = convert(values, fromUnit, toUnit, category, out=values).tolist()
+    for i, row in enumerate(rows):
+        if valid is not None and not valid[i]:
+            continue
+        if category == "temperature" and tooCold[i]:
+            row[column] = "Error"
+        else:
+            row[column] = results[i]
+
+
+def convert_binary(inputPath, outputPath, category, fromUnit, toUnit, dtype="float64", chunkSize=2 ** 20):
+    """
+    Convert a raw file of float32/float64 values (native byte order)
+    through memory maps, chunkSize values at a time so the working set
+    stays small enough for the page cache, with no per-value Python work.
+    If outputPath is None the file is converted in place. Returns the
+    number of values converted.
+    """
+    dtype = numpy.dtype(dtype)
+    count = os.path.getsize(inputPath) // dtype.itemsize
+    if outputPath is None or os.path.abspath(outputPath) == os.path.abspath(inputPath):
+        source = target = numpy.memmap(inputPath, dtype=dtype, mode="r+", shape=(count,)) if count else None
+    else:
+        source = numpy.memmap(inputPath, dtype=dtype, mode="r", shape=(count,)) if count else None
+        target = numpy.memmap(outputPath, dtype=dtype, mode="w+", shape=(count,)) if count else None
+        if not count:
+            open(outputPath, "wb").close()
+    for start in range(0, count, chunkSize):
+        stop = min(start + chunkSize, count)
+        convert(source[start:stop], fromUnit, toUnit, category, out=target[start:stop])
+    if target is not None:
+        target.flush()
+    return count
+
+
+def run_convert_command(options):
+    if options.binary is not None:
+        return run_convert_binary_command(options)
+    delimiter = options.delimiter
+    if delimiter is None:
+        delimiter = "\t" if options.input.lower().endswith(".tsv") else ","
+    columns = [int(column) - 1 if column.isdigit() else column for column in options.columns.split(",")]
+    if -1 in columns:
+        print("CalcLab Error: column numbers start at 1", file=sys.stderr)
+        return 1
+    input = output = None
+    start = perf_counter()
+    try:
+        input = sys.stdin if options.input == "-" else open(options.input, "r", newline="")
+        output = sys.stdout if options.output == "-" else open(options.output, "w", newline="")
+        rowCount = convert_csv(input, output, options.category, options.fromUnit, options.toUnit, columns,
+                               delimiter, options.header, options.chunk_size)
+    except (KeyError, ValueError, OSError) as error:
+        print(f"CalcLab Error: {error}", file=sys.stderr)
+        return 1
+    finally:
+        if input not in (None, sys.stdin):
+            input.close()
+        if output not in (None, sys.stdout):
+            output.close()
+    elapsed = perf_counter() - start
+    print(f"Converted {rowCount:,} rows in {elapsed:.2f}s ({rowCount / max(elapsed, 1e-9):,.0f} rows/s)",
+          file=sys.stderr)
+    return 0
+
+
+def run_convert_binary_command(options):
+    if options.input == "-":
+        print("CalcLab Error: --binary needs an input file", file=sys.stderr)
+        return 1
+    start = perf_counter()
+    try:
+        count = convert_binary(options.input, None if options.output == "-" else options.output, options.category,
+                               options.fromUnit, options.toUnit, options.binary)
+    except (KeyError, ValueError, OSError) as error:
+        print(f"CalcLab Error: {error}", file=sys.stderr)
+        return 1
+    elapsed = perf_counter() - start
+    size = count * numpy.dtype(options.binary).itemsize
+    print(f"Converted {count:,} values in {elapsed:.2f}s ({size / max(elapsed, 1e-9) / 1024 ** 2:,.0f} MB/s)",
+          file=sys.stderr)
+    return 0
+
+
+def run_rate_server_command(options):
+    rates = None
+    if options.fixtures is not None:
+        try:
+            with open(options.fixtures, "r") as file:
+                rates = json.load(file)
+        except (OSError, ValueError) as error:
+            print(f"CalcLab Error: {error}", file=sys.stderr)
+            return 1
+    server = RateServer(rates, options.latency, options.error_rate, options.seed, options.port).start()
+    print(f"Serving rates on {server.url}, press Ctrl+C to stop.\n"
+          f"Run the app with CALCLAB_RATE_SERVER={server.url} to use them.", file=sys.stderr)
+    try:
+        while True:
+            sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+def run_bench_command(options):
+    return 1 if benchmarks[options.benchmark]() is None else 0
+
+
+def benchmark_startup(repeat=5):
+    """
+    Time from creating CalcLab to its first drawn window, building every
+    page up front against building pages on first use, then the time each
+    page takes to build. Needs a display.
+    """
+    def start_app(lazy):
+        start = perf_counter()
+        app = CalcLab(lazy=lazy)
+        app.update()
+        elapsed = perf_counter() - start
+        return app, elapsed
+
+    try:
+        start_app(True)[0].destroy()  # warm up Tk and the imports
+    except tk.TclError as error:
+        print(f"CalcLab Error: the startup benchmark needs a display ({error})", file=sys.stderr)
+        return None
+    times = {}
+    for lazy in (False, True):
+        elapsed = []
+        for _ in range(repeat):
+            app, seconds = start_app(lazy)
+            elapsed.append(seconds)
+            app.destroy()
+        times[lazy] = min(elapsed)
+    print(f"{'startup':<24}{'time':>10}")
+    print(f"{'all pages (eager)':<24}{times[False] * 1000:>8.1f}ms")
+    print(f"{'first page (lazy)':<24}{times[True] * 1000:>8.1f}ms")
+
+    app = CalcLab()
+    print(f"\n{'page':<24}{'build':>10}")
+    for page_name in app.factories:
+        if page_name not in app.frames:
+            start = perf_counter()
+            app.get_frame(page_name)
+            app.update()
+            print(f"{page_name:<24}{(perf_counter() - start) * 1000:>8.1f}ms")
+    app.destroy()
+    return times
+
+
+def benchmark_imports():
+    """
+    Import-time report of CalcLab, like python -X importtime: the total
+    time to import main.py, its slowest direct imports, and the optional
+    modules by themselves. None of the optional modules should be
+    imported by main.py itself.
+    """
+    def import_times(module):
+        # "import time: self [us] | cumulative | imported package", the name indented
+        # two spaces per nesting level and printed after everything it imports
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        entries = []
+        for line in process.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, cumulative, name = line.split("|")
+                if cumulative.strip().isdigit():
+                    depth = (len(name) - len(name.lstrip()) - 1) // 2
+                    entries.append((depth, name.strip(), int(cumulative) / 1000))
+        return entries
+
+    def cumulative(entries, module):
+        return next((ms for depth, name, ms in entries if depth == 0 and name == module), 0)
+
+    moduleName = os.path.splitext(os.path.basename(__file__))[0]
+    entries = import_times(moduleName)
+    position = next(i for i, (depth, name, ms) in enumerate(entries) if depth == 0 and name == moduleName)
+    imported = []
+    for depth, name, ms in reversed(entries[:position]):
+        if depth == 0:
+            break
+        if depth == 1:
+            imported.append((ms, name))
+    print(f"{'import':<32}{'cumulative':>12}")
+    print(f"{moduleName + '.py':<32}{entries[position][2]:>10.1f}ms")
+    for ms, name in sorted(imported, reverse=True)[:10]:
+        print(f"  {name:<30}{ms:>10.1f}ms")
+
+    names = {name for depth, name, ms in entries[:position + 1]}
+    loaded = [name for name in optionalModules if name in names]
+    print(f"\noptional modules imported by {moduleName}.py: {', '.join(loaded) or 'none'}")
+    for module in optionalModules:
+        if missing_modules(module):
+            print(f"  {module:<30}{'missing':>12}")
+        else:
+            print(f"  {module:<30}{cumulative(import_times(module), module):>10.1f}ms")
+    return entries
+
+
+def benchmark_rate_providers(conversions=200, threads=16, latency=0.02, errorRate=0.2):
+    """
+    Load test of the currency path against a local RateServer: many
+    threads converting random currency pairs, fetching directly, through
+    SingleFlight coalescing, through the RateTable cache, and coalescing
+    while the server fails errorRate of its answers (retried with
+    backoff). The errors are seeded, so runs are reproducible.
+    """
+    pairs = [tuple(random.Random(i).sample(currency, 2)) for i in range(conversions)]
+
+    def direct(client, flight, table, pair):
+        client.get_rates("USD")
+        client.get_bitcoin_price("USD")
+
+    def coalesced(client, flight, table, pair):
+        LiveRateProvider(client, flight).fetch_rates("USD")
+
+    def cached(client, flight, table, pair):
+        table.get_rate(*pair, LiveRateProvider(client, flight).fetch_rates)
+
+    print(f"{'path':<24}{'time':>9}{'conversions/s':>15}{'requests':>10}{'coalesced':>11}{'errors':>8}")
+    results = {}
+    for name, run, errors in (("direct", direct, 0), ("coalesced", coalesced, 0), ("cached", cached, 0),
+                              (f"coalesced, {errorRate:.0%} errors", coalesced, errorRate)):
+        with RateServer(latency=latency, errorRate=errors, seed=0) as server:
+            client = RateClient(server.ratesUrl, server.bitcoinUrl, backoff=latency)
+            flight = SingleFlight()
+            table = RateTable(currency, RateCache(path=None))
+            start = perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+                list(executor.map(lambda pair: run(client, flight, table, pair), pairs))
+            elapsed = perf_counter() - start
+            results[name] = (elapsed, server.requests, flight.coalesced, server.errors)
+            print(f"{name:<24}{elapsed:>8.3f}s{conversions / elapsed:>15,.0f}{server.requests:>10}"
+                  f"{flight.coalesced:>11}{server.errors:>8}")
+    return results
+
+
+def benchmark_rate_history(rows=10 ** 6, years=10):
+    """
+    Batch conversion of (amount, currency, date) rows at historical rates
+    from a RateHistory of daily random-walk rates: a Python loop of
+    get_rate calls against one vectorized convert, with currencies given
+    as column numbers and as codes.
+    """
+    import tempfile
+
+    generator = numpy.random.default_rng(0)
+    days = years * 365
+    first = numpy.datetime64("2000-01-01")
+    base = numpy.array([rateFixtures[code] for code in currency])
+    walk = numpy.exp(numpy.cumsum(generator.normal(0, 0.005, (days, len(currency))), axis=0))
+    amounts = generator.random(rows) * 1000
+    fromIndexes = generator.integers(0, len(currency), rows)
+    toIndexes = generator.integers(0, len(currency), rows)
+    dates = first + generator.integers(0, days, rows)
+    with tempfile.TemporaryDirectory() as directory:
+        history = RateHistory(os.path.join(directory, "rates_history"))
+        start = perf_counter()
+        history.extend(first + numpy.arange(days), base * walk)
+        print(f"stored {days:,} days of {len(currency)} rates in {perf_counter() - start:.3f}s")
+
+        sample = 10 ** 4
+        fromCodes = numpy.array(currency)[fromIndexes]
+        toCodes = numpy.array(currency)[toIndexes]
+        start = perf_counter()
+        for i in range(sample):
+            amounts[i] * history.get_rate(fromCodes[i], toCodes[i], dates[i])
+        loop = (perf_counter() - start) * rows / sample
+        start = perf_counter()
+        history.convert(amounts, fromIndexes, toIndexes, dates)
+        indexed = perf_counter() - start
+        start = perf_counter()
+        history.convert(amounts, fromCodes, toCodes, dates)
+        coded = perf_counter() - start
+        del history
+    print(f"{'convert ' + format(rows, ',') + ' rows':<32}{'time':>10}{'rows/s':>16}")
+    for name, seconds in (("get_rate loop (estimated)", loop), ("vectorized, column numbers", indexed),
+                          ("vectorized, currency codes", coded)):
+        print(f"{name:<32}{seconds:>9.3f}s{rows / seconds:>16,.0f}")
+    return loop, indexed, coded
+
+
+def benchmark_history_search(entries=10 ** 6, repeat=200):
+    """
+    HistoryStore.search() over a history of random calculations, each
+    query against the same search done by reading the whole table (a
+    LIKE on the history text, a range of resultValue, or a range of
+    resultValue and of the operands).
+    """
+    import tempfile
+
+    generator = random.Random(0)
+    unary = ("sqrt", "square", "cube", "sin", "cos", "ln", "factorial")
+    binary = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv}
+    queries = (("sqrt", "SELECT id, text FROM history WHERE text LIKE 'sqrt%'"),
+               ("between 100 and 200", "SELECT id, text FROM history NOT INDEXED "
+                                       "WHERE resultValue BETWEEN 100 AND 200"),
+               ("contains 3.14159", "SELECT id, text FROM history NOT INDEXED "
+                                    "WHERE resultValue >= 3.14159 AND resultValue < 3.1416 OR id IN "
+                                    "(SELECT id FROM historyOperands NOT INDEXED "
+                                    "WHERE value >= 3.14159 AND value < 3.1416)"))
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(os.path.join(directory, "history.db"), maxEntries=entries + 1, maxDelay=3600,
+                             maxRows=None, maxBytes=None, archive=None)
+        start = perf_counter()
+        for i in range(entries):
+            if i % 10 == 0:
+                value = math.pi if i % 1000 == 0 else round(generator.uniform(0, 1000), generator.randint(0, 8))
+                name = generator.choice(unary)
+                result = math.sqrt(value) if name == "sqrt" else value * 2
+                store.write(name, [value], result, f"{name}({value}) = {formatter.format(result)}")
+            else:
+                left, right = generator.randint(-999, 999), round(generator.uniform(0.001, 1000), 5)
+                symbol = generator.choice(list(binary))
+                result = binary[symbol](left, right)
+                store.write(symbol, [left, right], result, f"{left} {symbol} {right} = {formatter.format(result)}")
+        store.flush()
+        print(f"wrote and indexed {entries:,} calculations in {perf_counter() - start:.3f}s")
+        results = {}
+        print(f"{'query':<24}{'shown':>6}{'indexed':>12}{'table scan':>13}")
+        for query, scan in queries:
+            start = perf_counter()
+            for _ in range(repeat):
+                matches = store.search(query)
+            indexed = (perf_counter() - start) / repeat
+            start = perf_counter()
+            store.query(scan)
+            scanned = perf_counter() - start
+            results[query] = (indexed, scanned)
+            print(f"{query:<24}{len(matches):>6}{indexed * 1000:>10.3f}ms{scanned * 1000:>11.1f}ms")
+        store.close()
+    return results
+
+
+"""
+Benchmarks that can be run with: python main.py bench [name]
+"""
+benchmarks = {"conversion": benchmark_conversion_matrices,
+              "parallel": benchmark_parallel_conversion,
+              "startup": benchmark_startup,
+              "imports": benchmark_imports,
+              "rates": benchmark_rate_providers,
+              "history": benchmark_rate_history,
+              "search": benchmark_history_search}
+
+
+def run_command_line(args):
+    """Command line tools, used when main.py is run with arguments."""
+    parser = argparse.ArgumentParser(prog="main.py", description="CalcLab command line tools. Run main.py "
+                                     "without arguments to open the app.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convertParser = subparsers.add_parser("convert", help="convert columns of a CSV/TSV file between units")
+    convertParser.add_argument("category", choices=list(unitCategories) + ["temperature"])
+    convertParser.add_argument("fromUnit", metavar="from", help='unit to convert from (i.e. "Meters")')
+    convertParser.add_argument("toUnit", metavar="to", help='unit to convert to (i.e. "Feet")')
+    convertParser.add_argument("-i", "--input", default="-", help="input file (default: stdin)")
+    convertParser.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    convertParser.add_argument("-c", "--columns", default="1",
+                               help="comma-separated columns to convert, 1-based or header names (default: 1)")
+    convertParser.add_argument("-d", "--delimiter", help="field delimiter (default: tab for .tsv, else comma)")
+    convertParser.add_argument("--header", action="store_true", help="the first row is a header")
+    convertParser.add_argument("--chunk-size", type=int, default=65536, help="rows per chunk (default: 65536)")
+    convertParser.add_argument("--binary", choices=["float32", "float64"],
+                               help="input is a raw file of this type; converted through memory maps, in place "
+                               "unless -o is given")
+    convertParser.set_defaults(handler=run_convert_command)
+
+    benchParser = subparsers.add_parser("bench", help="run a benchmark")
+    benchParser.add_argument("benchmark", choices=list(benchmarks))
+    benchParser.set_defaults(handler=run_bench_command)
+
+    serverParser = subparsers.add_parser("rate-server", help="serve recorded exchange rates on localhost, "
+                                         "for offline testing")
+    serverParser.add_argument("-p", "--port", type=int, default=8000, help="port to listen on (default: 8000)")
+    serverParser.add_argument("--fixtures", help="JSON file of units per 1 USD for each currency, BTC included "
+                              "(default: built-in recorded rates)")
+    serverParser.add_argument("--latency", type=float, default=0, help="seconds to wait before each answer")
+    serverParser.add_argument("--error-rate", type=float, default=0, help="fraction of answers that fail with 503")
+    serverParser.add_argument("--seed", type=int, default=0, help="seed for the injected errors (default: 0)")
+    serverParser.set_defaults(handler=run_rate_server_command)
+
+    options = parser.parse_args(args)
+    try:
+        return options.handler(options)
+    except ImportError as error:
+        print(f"CalcLab Error: {error}", file=sys.stderr)
+        return 1
+
+
+class ExpressionEvaluator:
+    """
+    Safe replacement for eval() on user input. Input is parsed once into a
+    restricted AST (numbers, +, -, *, /, //, %, ** and parentheses only),
+    compiled into nested closures, and cached by its normalized text.
+    Expressions are constant, so their values are cached too (the last
+    valueCacheSize of them, as they can be huge integers) and evaluating
+    a repeated or re-displayed value is a dictionary lookup.
+    Names raise NameError; any other construct (attributes, calls,
+    subscripts, ...) raises SyntaxError. estimate() computes small
+    exponents to size powers, but only those costing at most inlineCost
+    digits; more expensive exponents are treated as unbounded.
+    """
+
+    unaryOperators = {ast.UAdd: operator.pos,
+                      ast.USub: operator.neg}
+
+    binaryOperators = {ast.Add: operator.add,
+                       ast.Sub: operator.sub,
+                       ast.Mult: operator.mul,
+                       ast.Div: operator.truediv,
+                       ast.FloorDiv: operator.floordiv,
+                       ast.Mod: operator.mod,
+                       ast.Pow: operator.pow}
+
+    def __init__(self, cacheSize=1024, inlineCost=10 ** 4, valueCacheSize=64):
+        self.inlineCost = inlineCost
+        self.parse = functools.lru_cache(maxsize=cacheSize)(self.parse)
+        self.compile = functools.lru_cache(maxsize=cacheSize)(self.compile)
+        self.value = functools.lru_cache(maxsize=valueCacheSize)(self.value)
+
+    def evaluate(self, text):
+        return self.value(self.normalize(text))
+
+    def value(self, text):
+        return self.compile(text)()
+
+    def estimate(self, text):
+        """
+        Estimate the number of digits of the largest integer the expression
+        would produce, from operand and exponent sizes, without evaluating
+        it. Float results are limited by the float range and cost nothing
+        to compute, so they do not count.
+        """
+        return self.magnitude(self.parse(self.normalize(text)))[2]
+
+    def normalize(self, text):
+        return str(text).replace(",", "").strip()
+
+    def parse(self, text):
+        return ast.parse(text, mode="eval").body
+
+    def compile(self, text):
+        return self.build(self.parse(text))
+
+    def build(self, node):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            value = node.value
+            return lambda: value
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.unaryOperators:
+            unary = self.unaryOperators[type(node.op)]
+            operand = self.build(node.operand)
+            return lambda: unary(operand())
+        if isinstance(node, ast.BinOp) and type(node.op) in self.binaryOperators:
+            binary = self.binaryOperators[type(node.op)]
+            left = self.build(node.left)
+            right = self.build(node.right)
+            return lambda: binary(left(), right())
+        if isinstance(node, ast.Name):
+            raise NameError(f"name '{node.id}' is not allowed")
+        raise SyntaxError(f"'{type(node).__name__}' is not allowed in an expression")
+
+    def magnitude(self, node):
+        """
+        Return (digits, isInteger, cost) of a node, where digits is an upper
+        bound of log10(abs(result)) and cost is the digit count of the
+        largest integer computed anywhere below it.
+        """
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            digits = count_digits(node.value)
+            isInteger = isinstance(node.value, int)
+            return digits, isInteger, digits if isInteger else 0
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.unaryOperators:
+            return self.magnitude(node.operand)
+        if isinstance(node, ast.BinOp) and type(node.op) in self.binaryOperators:
+            left, leftInteger, leftCost = self.magnitude(node.left)
+            right, rightInteger, rightCost = self.magnitude(node.right)
+            isInteger = leftInteger and rightInteger and not isinstance(node.op, ast.Div)
+            if isinstance(node.op, ast.Pow):
+                if right <= 18 and rightCost <= self.inlineCost:
+                    exponent = self.build(node.right)()
+                    digits = abs(exponent) * left
+                    if exponent < 0:
+                        isInteger = False
+                else:
+                    digits = 0 if left == 0 else math.inf
+            elif isinstance(node.op, ast.Mult):
+                digits = left + right
+            elif isinstance(node.op, (ast.Add, ast.Sub)):
+                digits = max(left, right) + math.log10(2)
+            elif isinstance(node.op, ast.Mod):
+                digits = right
+            else:
+                digits = left
+            if not isInteger:
+                digits = min(digits, 309)
+            return digits, isInteger, max(leftCost, rightCost, digits if isInteger else 0)
+        return 0, False, 0
+
+
+evaluator = ExpressionEvaluator()
+
+
+def count_digits(value):
+    """Return log10(abs(value)), or 0 for values smaller than 1."""
+    try:
+        return max(math.log10(abs(value)), 0) if value else 0
+    except (OverflowError, ValueError):
+        return math.inf
+
+
+def evaluate_expression(text):
+    """Module-level wrapper so evaluations can be sent to worker processes."""
+    return evaluator.evaluate(text)
+
+
+def apply_operation(operation, text):
+    """Evaluate text and apply a single-operand operation to it."""
+    return apply_value(operation, evaluator.evaluate(text))
+
+
+def apply_value(operation, value):
+    return value, operation(value)
+
+
+class NumberFormatter:
+    """
+    Formats results for the answer field. Fixed or scientific notation is
+    decided from bit length and log10, so huge integers (i.e. factorials)
+    are never converted into a full decimal string and render instantly
+    whatever their size.
+    """
+
+    def __init__(self, maxDigits=18):
+        self.maxDigits = maxDigits
+
+    def format(self, value):
+        """
+        Return the display text of value, with thousands separators in
+        fixed notation. Raises ValueError or OverflowError for nan/inf.
+        """
+        if isinstance(value, FactorialResult):
+            return value.scientific()
+        if not isinstance(value, int):
+            value = float(value)
+            if not math.isfinite(value):
+                raise OverflowError("Cannot display nan or inf")
+            if not value.is_integer():
+                return self.format_float(value)
+            if abs(value) < 2 ** 63:
+                value = int(value)
+            else:
+                return f"{value:e}"
+        limit = 10 ** self.maxDigits
+        if -limit // 10 < value < limit:  # digits, including the minus sign
+            return f"{value:,}"
+        return self.scientific(value)
+
+    def format_float(self, value):
+        integerDigits = len(str(int(value))) if abs(value) < 10 ** self.maxDigits else self.maxDigits + 1
+        if integerDigits > self.maxDigits:
+            return f"{value:e}"
+        rounded = round(value, self.maxDigits - integerDigits)
+        if rounded == 0:  # too small for fixed notation
+            return f"{value:e}"
+        return f"{rounded:,}"
+
+    def plain(self, value):
+        """Format value without separators (i.e. for history)."""
+        if isinstance(value, FactorialResult):
+            return value.digits(3000)
+        if isinstance(value, int) and value.bit_length() > 10000:
+            return self.scientific(value)
+        return str(value)
+
+    def exact(self, value, limit):
+        """Exact decimal digits of an integer result if there are at most limit of them, otherwise scientific."""
+        if isinstance(value, FactorialResult):
+            return value.digits(limit)
+        if count_digits(value) >= limit:
+            return self.scientific(value)
+        return int_to_str(value)
+
+    def scientific(self, value):
+        """Format an integer of any size like f"{value:e}", from its top 64 bits only."""
+        if value.bit_length() <= 1000:
+            return f"{value:e}"
+        sign = "-" if value < 0 else ""
+        value = abs(value)
+        shift = value.bit_length() - 64
+        exponent10 = math.log10(value >> shift) + shift * math.log10(2)
+        exponent = math.floor(exponent10)
+        mantissa = f"{10 ** (exponent10 - exponent):.6f}"
+        if mantissa.startswith("10"):
+            mantissa = f"{1:.6f}"
+            exponent += 1
+        return f"{sign}{mantissa}e+{exponent:02d}"
+
+
+formatter = NumberFormatter()
+
+
+def int_to_str(value):
+    """str() for integers of any length, past Python's int_max_str_digits limit."""
+    if not hasattr(sys, "set_int_max_str_digits"):
+        return str(value)
+    limit = sys.get_int_max_str_digits()
+    sys.set_int_max_str_digits(0)
+    try:
+        return str(value)
+    finally:
+        sys.set_int_max_str_digits(limit)
+
+
+class FactorialTable:
+    """
+    Factorials for the Calculator. Recent exact results are kept in an LRU
+    table, non-integers use the gamma function, and integers above
+    exactLimit are returned as a FactorialResult approximated from lgamma,
+    whose exact digits are only computed when they are asked for. Past
+    maxExponent decimal digits a float lgamma has no precision left for
+    the mantissa, so those raise OverflowError.
+    """
+
+    def __init__(self, cacheSize=32, exactLimit=1000, copyDigits=10 ** 5, maxExponent=2 ** 52):
+        self.exactLimit = exactLimit
+        self.maxExponent = maxExponent
+        self.copyDigits = copyDigits
+        self.exact = functools.lru_cache(maxsize=cacheSize)(math.factorial)
+
+    def factorial(self, value):
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if not isinstance(value, int):
+            return math.gamma(value + 1)
+        if value < 0:
+            raise ValueError("factorial() not defined for negative values")
+        if value <= self.exactLimit:
+            return self.exact(value)
+        return FactorialResult(value, *self.approximate(value))
+
+    def approximate(self, n):
+        """Return (mantissa, exponent) of n! from lgamma."""
+        exponent10 = math.lgamma(n + 1) / math.log(10)
+        if exponent10 > self.maxExponent:
+            raise OverflowError("Result is too large")
+        exponent = math.floor(exponent10)
+        return 10 ** (exponent10 - exponent), exponent
+
+
+class FactorialResult:
+    """n! known by mantissa and exponent, with exact digits computed lazily."""
+
+    def __init__(self, n, mantissa, exponent):
+        self.n = n
+        self.mantissa = mantissa
+        self.exponent = exponent
+
+    def scientific(self):
+        mantissa = f"{self.mantissa:.6f}"
+        if mantissa.startswith("10"):
+            return f"{1:.6f}e+{self.exponent + 1:02d}"
+        return f"{mantissa}e+{self.exponent:02d}"
+
+    def digits(self, limit):
+        """Exact decimal digits if there are at most limit of them, otherwise the scientific form."""
+        if self.exponent >= limit:
+            return self.scientific()
+        return int_to_str(factorials.exact(self.n))
+
+
+factorials = FactorialTable()
+
+
+class EvaluationBudget:
+    """
+    Limits for the Calculator's bounded evaluation mode. Results are sized
+    up front; anything over maxDigits is rejected straight away, anything
+    over inlineDigits runs in a worker process which is killed once it goes
+    over its time (seconds) or memory (bytes) budget.
+    """
+
+    def __init__(self, maxDigits=10 ** 6, inlineDigits=10 ** 4, timeout=5, memoryLimit=2 * 1024 ** 3):
+        self.maxDigits = maxDigits
+        self.inlineDigits = inlineDigits
+        self.timeout = timeout
+        self.memoryLimit = memoryLimit
+
+    def check(self, digits):
+        """Return True if work of this size can run inline."""
+        if digits > self.maxDigits:
+            raise OverflowError("Result is too large")
+        return digits <= self.inlineDigits
+
+    def start(self, function, *args):
+        return BoundedTask(function, args, self.timeout, self.memoryLimit)
+
+
+class BoundedTask:
+    """A calculation running in a worker process that can be cancelled."""
+
+    def __init__(self, function, args, timeout, memoryLimit):
+        context = multiprocessing.get_context()
+        self.__receiver, sender = context.Pipe(duplex=False)
+        self.__process = context.Process(target=run_bounded_task, args=(sender, memoryLimit, function, args),
+                                         daemon=True)
+        self.__process.start()
+        sender.close()
+        self.__deadline = monotonic() + timeout
+
+    def poll(self):
+        """
+        Return (done, result). Errors raised by the calculation are raised
+        here; going over the time or memory budget raises OverflowError.
+        """
+        if self.__receiver.poll():
+            try:
+                isError, result = self.__receiver.recv()
+            except EOFError:
+                raise OverflowError("Calculation ran out of memory")
+            finally:
+                self.cancel()
+            if isError:
+                raise result
+            return True, result
+        if not self.__process.is_alive():
+            self.cancel()
+            raise OverflowError("Calculation ran out of memory")
+        if monotonic() > self.__deadline:
+            self.cancel()
+            raise OverflowError("Calculation took too long")
+        return False, None
+
+    def cancel(self):
+        if self.__process.is_alive():
+            self.__process.terminate()
+        self.__process.join()
+        self.__receiver.close()
+
+
+def run_bounded_task(connection, memoryLimit, function, args):
+    """Worker process entry point for BoundedTask."""
+    if memoryLimit is not None and resource is not None:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memoryLimit, memoryLimit))
+        except (ValueError, OSError):
+            pass
+    try:
+        result = (False, function(*args))
+    except Exception as error:
+        result = (True, error)
+    connection.send(result)
+
+
+class CalculatorEngine:
+    """
+    Headless calculation engine behind the Calculator page. It owns the
+    memory/operator/repeat-value state machine and all the math, so
+    calculations can be run without building any Tk widget.
+    """
+
+    # module functions, so operations can be sent to worker processes
+    operations = {"+": operator.add,
+                  "-": operator.sub,
+                  "*": operator.mul,
+                  "/": operator.truediv}
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.value = 0
+        self.memory = 0
+        self.reVal = 0
+        self.operator = None
+        self.expression = None
+
+    def set_operator(self, operator, value):
+        if operator not in self.operations:
+            raise ValueError(f"Unknown operator: {operator}")
+        self.memory = value
+        self.reVal = 0
+        self.operator = operator
+
+    def equal(self, value):
+        """
+        Apply the pending operator to memory and value, then return the
+        result. Calling it again repeats the last operation with the same
+        second operand (i.e. 5 + 2 = = gives 9). Returns None if there is
+        no pending operator.
+        """
+        if self.operator is None:
+            return None
+        left, right = self.operands(value)
+        return self.store(left, right, self.operations[self.operator](left, right))
+
+    def store(self, left, right, result):
+        """Record the result of the pending operator on left and right (computed elsewhere) as equal() does."""
+        self.value = result
+        self.reVal = right
+        self.expression = (left, self.operator, right)
+        return result
+
+    def operands(self, value):
+        """Return the operands the next equal() would use."""
+        if self.reVal == 0:
+            return self.memory, value
+        return self.value, self.reVal
+
+    def magnitude(self, operation, *values):
+        """
+        Estimate the digit count of an integer result from its operands
+        without computing it. Float results are limited by the float range
+        and cost nothing to compute, so they give 0.
+        """
+        if not all(isinstance(value, int) for value in values):
+            return 0
+        digits = [count_digits(value) for value in values]
+        if operation in ("+", "-"):
+            return max(digits) + math.log10(2)
+        if operation == "*":
+            return sum(digits)
+        if operation == "square":
+            return 2 * digits[0]
+        if operation == "cube":
+            return 3 * digits[0]
+        if operation == "factorial":
+            # large factorials are approximated from lgamma, which costs nothing
+            if not 0 <= values[0] <= factorials.exactLimit:
+                return 0
+            return math.lgamma(values[0] + 1) / math.log(10)
+        return max(digits)
+
+    def percent(self, value):
+        return value / 100
+
+    def square(self, value):
+        return value ** 2
+
+    def cube(self, value):
+        return value ** 3
+
+    def sqrt(self, value):
+        return math.sqrt(value)
+
+    def cbrt(self, value):
+        return numpy.cbrt(value)
+
+    def sin(self, value):
+        return math.sin(math.radians(value))
+
+    def cos(self, value):
+        return math.cos(math.radians(value))
+
+    def tan(self, value):
+        return math.tan(math.radians(value))
+
+    def sinh(self, value):
+        return math.sinh(value)
+
+    def cosh(self, value):
+        return math.cosh(value)
+
+    def tanh(self, value):
+        return math.tanh(value)
+
+    def ln(self, value):
+        return math.log(value)
+
+    def log10(self, value):
+        return math.log10(value)
+
+    def factorial(self, value):
+        return factorials.factorial(value)
+
+
+class RateCache:
+    """
+    Exchange rates keyed by (base, target), each kept for ttl seconds. At
+    most maxSize rates are kept, evicting the least recently used first.
+    A snapshot of the rates is saved to path after every fetch and loaded
+    on start, so a restart within the ttl needs no network. It is used
+    from the network threads, so every access takes lock.
+    """
+
+    def __init__(self, ttl=600, maxSize=1024, path="rates.json"):
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.path = path
+        self.rates = {}  # (base, target) -> (rate, fetchedAt), least recently used first
+        self.lock = threading.RLock()
+        self.load()
+
+    def get(self, base, target):
+        """Return (rate, fetchedAt) if a fresh rate is cached, else None."""
+        if base == target:
+            return 1.0, datetime.now().timestamp()
+        with self.lock:
+            for key, invert in (((base, target), False), ((target, base), True)):
+                entry = self.rates.pop(key, None)
+                if entry is None:
+                    continue
+                if datetime.now().timestamp() - entry[1] >= self.ttl:
+                    continue  # expired, leave it out
+                self.rates[key] = entry
+                return (1 / entry[0], entry[1]) if invert else entry
+        return None
+
+    def put(self, base, target, rate, fetchedAt=None):
+        with self.lock:
+            self.rates.pop((base, target), None)
+            self.rates[base, target] = (rate, datetime.now().timestamp() if fetchedAt is None else fetchedAt)
+            while len(self.rates) > self.maxSize:
+                del self.rates[next(iter(self.rates))]
+
+    def get_rate(self, base, target, fetch):
+        """Return (rate, fetchedAt), calling fetch(base, target) for the rate if it is not cached."""
+        entry = self.get(base, target)
+        if entry is None:
+            rate = fetch(base, target)
+            with self.lock:
+                self.put(base, target, rate)
+                entry = self.rates[base, target]
+            self.save()
+        return entry
+
+    def load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r") as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            return
+        now = datetime.now().timestamp()
+        for base, target, rate, fetchedAt in snapshot.get("rates", []):
+            if now - fetchedAt < self.ttl:
+                self.put(base, target, rate, fetchedAt)
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:  # also keeps two threads from writing the same temporary file
+            snapshot = {"rates": [[base, target, rate, fetchedAt]
+                                  for (base, target), (rate, fetchedAt) in self.rates.items()]}
+            try:
+                with open(self.path + ".tmp", "w") as file:
+                    json.dump(snapshot, file)
+                os.replace(self.path + ".tmp", self.path)
+            except OSError:
+                pass  # the snapshot is only an optimization
+
+
+class RateTable:
+    """
+    Every exchange rate between currencies, derived locally from one bulk
+    fetch of all rates against base. fetch(base) returns a dict of
+    currency -> units per 1 base (BTC included). The fetched rates are
+    stored in cache as (base, currency) entries, and cross rates come from
+    a ConversionMatrix, so switching currencies needs no network until
+    the rates expire. Concurrent refreshes share one, through a
+    SingleFlight.
+    """
+
+    def __init__(self, currencies, cache, base="USD"):
+        self.currencies = currencies
+        self.cache = cache
+        self.base = base
+        self.matrix = None
+        self.fetchedAt = None
+        self.refreshes = 0  # number of bulk fetches
+        self.flight = SingleFlight()
+
+    def get_rate(self, fromCurrency, toCurrency, fetch):
+        """
+        Return (rate, fetchedAt) for 1 fromCurrency in toCurrency. The rate
+        is NaN if the server has no rate for one of the currencies.
+        """
+        entry = self.lookup(fromCurrency, toCurrency)
+        if entry is None:
+            self.refresh(fetch)
+            entry = self.matrix.factor(fromCurrency, toCurrency), self.fetchedAt
+        return entry
+
+    def lookup(self, fromCurrency, toCurrency):
+        """Return (rate, fetchedAt) without any network, or None if the rates need a refresh."""
+        matrix, fetchedAt = self.matrix, self.fetchedAt
+        if matrix is None or datetime.now().timestamp() - fetchedAt >= self.cache.ttl:
+            return None
+        return matrix.factor(fromCurrency, toCurrency), fetchedAt
+
+    def refresh(self, fetch):
+        """Rebuild the matrix from the cache, fetching all rates at once if any are missing or expired."""
+        self.flight.do("refresh", self.rebuild, fetch)
+
+    def rebuild(self, fetch):
+        entries = [self.cache.get(self.base, currency) for currency in self.currencies]
+        if None in entries:
+            rates = fetch(self.base)
+            fetchedAt = datetime.now().timestamp()
+            entries = [(1.0 if currency == self.base else rates.get(currency, math.nan), fetchedAt)
+                       for currency in self.currencies]
+            for currency, (rate, _) in zip(self.currencies, entries):
+                self.cache.put(self.base, currency, rate, fetchedAt)
+            self.cache.save()
+            self.refreshes += 1
+        # value of one unit of each currency in base
+        matrix = ConversionMatrix({currency: 1 / rate if rate else math.nan
+                                   for currency, (rate, _) in zip(self.currencies, entries)})
+        self.matrix, self.fetchedAt = matrix, min(fetchedAt for _, fetchedAt in entries)
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers asking for a key
+    while its call is in flight wait for that call's result (or
+    exception) instead of calling again. started counts the calls made
+    and coalesced the callers that shared one.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> Future of the call in flight
+        self.started = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args):
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                future = self.calls[key] = concurrent.futures.Future()
+                self.started += 1
+                owner = True
+        if not owner:
+            return future.result()
+        try:
+            result = function(*args)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def stats(self):
+        total = self.started + self.coalesced
+        return {"started": self.started, "coalesced": self.coalesced,
+                "hitRate": self.coalesced / total if total else 0.0}
+
+
+class RatesNotAvailableError(Exception):
+    """The rate server answered, but without the rates asked for."""
+
+
+class RateClient:
+    """
+    HTTP client for the rate servers (theratesapi.com for currencies,
+    coindesk for BTC). All requests share one requests.Session, whose
+    connections are pooled and kept alive, at most perHost per host.
+    Failed requests (no connection, timeouts, 429 and 5xx answers) are
+    retried up to retries times with exponential backoff and full jitter.
+    """
+
+    ratesUrl = "https://theratesapi.com/api/"
+    bitcoinUrl = "https://api.coindesk.com/v1/bpi/"
+    retryStatus = {429, 500, 502, 503, 504}
+
+    def __init__(self, ratesUrl=None, bitcoinUrl=None, perHost=4, timeout=5, retries=3, backoff=0.25,
+                 maxBackoff=4):
+        self.ratesUrl = ratesUrl or self.ratesUrl
+        self.bitcoinUrl = bitcoinUrl or self.bitcoinUrl
+        self.perHost = perHost
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.session = None
+        self.lock = threading.Lock()
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.perHost,
+                                                        pool_block=True)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.session = session
+        return self.session
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt (0-based)."""
+        return random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** attempt))
+
+    def get_json(self, url, params=None):
+        session = self.get_session()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                sleep(self.delay(attempt - 1))
+            try:
+                response = session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                continue
+            if response.status_code not in self.retryStatus or attempt == self.retries:
+                break
+        if response.status_code != 200:
+            raise RatesNotAvailableError(f"{url} answered {response.status_code}")
+        try:
+            return response.json()
+        except ValueError as error:
+            raise RatesNotAvailableError(f"{url} answered with invalid JSON") from error
+
+    def get_rates(self, base, date=None):
+        """Units of every currency per 1 base, the latest or on date."""
+        url = self.ratesUrl + (date.isoformat() if date is not None else "latest")
+        return self.get_json(url, {"base": base, "rtype": "fpy"}).get("rates", {})
+
+    def get_bitcoin_price(self, currency, date=None):
+        """Price of 1 BTC in currency, the latest or the closing price on date."""
+        if date is None:
+            data = self.get_json(self.bitcoinUrl + f"currentprice/{currency}.json")
+            price = data.get("bpi", {}).get(currency, {}).get("rate_float")
+        else:
+            data = self.get_json(self.bitcoinUrl + "historical/close.json",
+                                 {"currency": currency, "start": date.isoformat(), "end": date.isoformat()})
+            price = data.get("bpi", {}).get(date.isoformat())
+        if not price:
+            raise RatesNotAvailableError(f"no BTC price in {currency}")
+        return price
+
+
+"""
+Recorded units per 1 USD, served by FixedRateProvider and RateServer.
+"""
+rateFixtures = {"AED": 3.6725, "AUD": 1.5328, "BRL": 5.4456, "CAD": 1.3701, "CHF": 0.8842, "CLP": 939.42,
+                "CNY": 7.2513, "COP": 3917.5, "CZK": 23.041, "DKK": 6.9312, "EUR": 0.92904, "GBP": 0.79078,
+                "HKD": 7.8122, "HUF": 365.86, "IDR": 16187.0, "ILS": 3.7244, "INR": 83.525, "JPY": 157.21,
+                "KRW": 1378.4, "MXN": 18.172, "MYR": 4.7085, "NOK": 10.657, "NZD": 1.6401, "PHP": 58.672,
+                "PLN": 4.0027, "RON": 4.6225, "RUB": 88.251, "SAR": 3.7502, "SEK": 10.515, "SGD": 1.3527,
+                "THB": 36.712, "TRY": 32.815, "TWD": 32.451, "USD": 1.0, "ZAR": 18.289, "BTC": 1 / 64231.5}
+
+
+class RateProvider(ABC):
+    """Source of exchange rates for rateTable and RateHistory."""
+
+    @abstractmethod
+    def fetch_rates(self, base, date=None):
+        """Return a dict of currency -> units per 1 base, BTC included, the latest or on date."""
+        pass
+
+
+class LiveRateProvider(RateProvider):
+    """Rates from the rate servers through a RateClient, one request in flight per key."""
+
+    def __init__(self, client, flight=None):
+        self.client = client
+        self.flight = flight or SingleFlight()
+
+    def fetch_rates(self, base, date=None):
+        # one request for all currencies, one for BTC
+        rates = dict(self.flight.do(("rates", base, date), self.client.get_rates, base, date))
+        rates[base] = 1.0  # left out by the rate server
+        try:
+            rates["BTC"] = 1 / self.flight.do(("BTC", base, date), self.client.get_bitcoin_price, base, date)
+        except (RatesNotAvailableError, requests.RequestException):
+            rates["BTC"] = math.nan  # only BTC is unavailable, keep the other rates
+        return rates
+
+
+class FixedRateProvider(RateProvider):
+    """Rates from a fixed table of units per 1 USD (BTC included), the same on every date, with no network."""
+
+    def __init__(self, rates=None):
+        self.rates = rates or rateFixtures
+        self.fetches = 0
+
+    def fetch_rates(self, base, date=None):
+        if base not in self.rates:
+            raise RatesNotAvailableError(f"no rates for {base}")
+        self.fetches += 1
+        return {target: rate / self.rates[base] for target, rate in self.rates.items()}
+
+
+class RateServer:
+    """
+    Local stand-in for the rate servers, answering the same URLs as
+    theratesapi.com and coindesk from a table of units per 1 USD (the same
+    on every date). Every
+    answer waits latency seconds, and a fraction errorRate of them fail
+    with 503, chosen by a random generator seeded with seed so runs are
+    reproducible. requests and errors count the answers. Point a
+    RateClient at it with RateClient(server.ratesUrl, server.bitcoinUrl).
+    """
+
+    def __init__(self, rates=None, latency=0, errorRate=0, seed=0, port=0):
+        self.rates = rates or rateFixtures
+        self.latency = latency
+        self.errorRate = errorRate
+        self.random = random.Random(seed)
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exception):
+        self.stop()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    @property
+    def ratesUrl(self):
+        return self.url + "/api/"
+
+    @property
+    def bitcoinUrl(self):
+        return self.url + "/v1/bpi/"
+
+    def answer(self, path):
+        """Return (status, body) for a GET of path."""
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.errorRate
+            self.errors += failed
+        if self.latency:
+            sleep(self.latency)
+        if failed:
+            return 503, {"error": "injected error"}
+        path, _, query = path.partition("?")
+        parameters = dict(parameter.partition("=")[::2] for parameter in query.split("&"))
+        if path.startswith("/api/"):
+            date = path[len("/api/"):]
+            base = parameters.get("base", "USD")
+            if base not in self.rates:
+                return 400, {"error": f"Base '{base}' is not supported."}
+            rates = {currency: rate / self.rates[base] for currency, rate in self.rates.items()
+                     if currency not in (base, "BTC")}
+            return 200, {"base": base, "date": datetime.today().date().isoformat() if date == "latest" else date,
+                         "rates": rates}
+        if path.startswith("/v1/bpi/currentprice/") and path.endswith(".json"):
+            currency = path[len("/v1/bpi/currentprice/"):-len(".json")]
+            if currency not in self.rates or currency == "BTC":
+                return 404, {"error": f"Sorry, the {currency} currency was not found"}
+            return 200, {"bpi": {currency: {"code": currency, "rate_float": self.rates[currency] / self.rates["BTC"]}}}
+        if path == "/v1/bpi/historical/close.json":
+            currency = parameters.get("currency", "USD")
+            if currency not in self.rates or currency == "BTC":
+                return 404, {"error": f"Sorry, the {currency} currency was not found"}
+            start, end = datetime.fromisoformat(parameters["start"]), datetime.fromisoformat(parameters["end"])
+            days = [(start + timedelta(days=day)).date().isoformat() for day in range((end - start).days + 1)]
+            return 200, {"bpi": {day: self.rates[currency] / self.rates["BTC"] for day in days}}
+        return 404, {"error": "not found"}
+
+    def start(self):
+        import http.server  # only needed here, and slow to import
+
+        rateServer = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real servers
+            disable_nagle_algorithm = True  # headers and body are written separately
+
+            def do_GET(self):
+                status, body = rateServer.answer(self.path)
+                body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class RateHistory:
+    """
+    Daily exchange rates on disk, in columns: path.dates holds the days
+    (int32 days since 1970-01-01, ascending) and path.rates a float64 row
+    per day of units per 1 USD for each currency, both memory-mapped, with
+    the currencies in path.json. A date uses the rates of the latest day
+    on or before it, found by binary search.
+    """
+
+    def __init__(self, path="rates_history", currencies=currency):
+        self.path = path
+        self.currencies = list(currencies)
+        self.dates = None
+        self.rates = None
+        self.load()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def load(self):
+        try:
+            with open(self.path + ".json", "r") as file:
+                self.currencies = json.load(file)["currencies"]
+        except (OSError, ValueError, KeyError):
+            pass
+        self.index = {code: i for i, code in enumerate(self.currencies)}
+        try:
+            # a write cut short leaves one file longer than the other
+            count = min(os.path.getsize(self.path + ".dates") // 4,
+                        os.path.getsize(self.path + ".rates") // (8 * len(self.currencies)))
+        except OSError:
+            count = 0
+        if count:
+            self.dates = numpy.memmap(self.path + ".dates", dtype=numpy.int32, mode="r", shape=(count,))
+            self.rates = numpy.memmap(self.path + ".rates", dtype=numpy.float64, mode="r",
+                                      shape=(count, len(self.currencies)))
+        else:
+            self.dates = numpy.empty(0, dtype=numpy.int32)
+            self.rates = numpy.empty((0, len(self.currencies)), dtype=numpy.float64)
+
+    def extend(self, dates, rows):
+        """Add days (dates after the last stored day, ascending) with their rows of rates."""
+        days = numpy.asarray(dates, dtype="datetime64[D]").astype(numpy.int32)
+        rows = numpy.asarray(rows, dtype=numpy.float64).reshape(len(days), len(self.currencies))
+        if not len(days):
+            return
+        if numpy.any(numpy.diff(days) <= 0) or len(self.dates) and days[0] <= self.dates[-1]:
+            raise ValueError("dates must be ascending and after the last stored day")
+        count = len(self.dates)
+        self.dates = self.rates = None  # unmap before the files grow
+        if not count:
+            with open(self.path + ".json", "w") as file:
+                json.dump({"currencies": self.currencies}, file)
+        for suffix, data in ((".rates", rows), (".dates", days)):
+            with open(self.path + suffix, "r+b" if count else "wb") as file:
+                file.seek(count * data[0:1].nbytes)
+                file.write(data.tobytes())
+                file.truncate()
+        self.load()
+
+    def append(self, date, rates):
+        """Add the rates of one day, a dict of currency -> units per 1 USD."""
+        self.extend([date], [[rates.get(code, math.nan) for code in self.currencies]])
+
+    def refresh(self, provider, end=None, days=30):
+        """
+        Fetch the days after the last stored one up to end (today), or the
+        last days days if nothing is stored yet, one fetch per day. Each day
+        is stored as soon as it is fetched. Returns the number of new days.
+        """
+        end = end or datetime.today().date()
+        if len(self.dates):
+            day = (numpy.datetime64(int(self.dates[-1]), "D") + 1).astype(object)
+        else:
+            day = end - timedelta(days=days - 1)
+        count = 0
+        while day <= end:
+            self.append(day, provider.fetch_rates("USD", day))
+            day += timedelta(days=1)
+            count += 1
+        return count
+
+    def day_indexes(self, dates):
+        """Row of the latest day on or before each date (-1 before the first day)."""
+        days = numpy.asarray(dates, dtype="datetime64[D]").astype(numpy.int64)
+        return numpy.searchsorted(self.dates, days, side="right") - 1
+
+    def currency_indexes(self, codes):
+        """Column of each currency, given as codes or as column numbers."""
+        codes = numpy.asarray(codes)
+        if codes.dtype.kind in "iu":
+            return codes
+        unique, inverse = numpy.unique(codes, return_inverse=True)
+        return numpy.array([self.index[code] for code in unique.tolist()], dtype=numpy.intp)[inverse]
+
+    def get_rate(self, fromCurrency, toCurrency, date):
+        day = int(self.day_indexes(date))
+        if day < 0:
+            raise RatesNotAvailableError(f"no rates on {date}")
+        row = self.rates[day]
+        return float(row[self.index[toCurrency]] / row[self.index[fromCurrency]])
+
+    def convert(self, amounts, fromCurrencies, toCurrencies, dates, out=None):
+        """
+        Convert each amount from one currency to another at the rates of its
+        date, as one vectorized gather from the memory-mapped rates with no
+        network. Amounts dated before the first stored day become NaN.
+        """
+        days = self.day_indexes(dates)
+        valid = days >= 0
+        days = numpy.where(valid, days, 0)
+        rates = self.rates if len(self.dates) else numpy.full((1, len(self.currencies)), math.nan)
+        toIndexes = self.currency_indexes(toCurrencies)
+        fromIndexes = self.currency_indexes(fromCurrencies)
+        factors = numpy.where(valid, rates[days, toIndexes] / rates[days, fromIndexes], math.nan)
+        return numpy.multiply(amounts, factors, out=out)
+
+
+def format_age(fetchedAt):
+    """How long ago a timestamp was, i.e. "Updated 5 minutes ago"."""
+    seconds = max(int(datetime.now().timestamp() - fetchedAt), 0)
+    if seconds < 10:
+        return "Updated just now"
+    for unit, length in (("day", 86400), ("hour", 3600), ("minute", 60), ("second", 1)):
+        if seconds >= length:
+            count = seconds // length
+            return f"Updated {count} {unit}{'s' if count != 1 else ''} ago"
+
+
+rateCache = RateCache()
+rateTable = RateTable(currency, rateCache)
+
+"""
+Where the currency page gets its rates. Set CALCLAB_RATE_SERVER to the URL
+of a stand-in server (python main.py rate-server) to use it instead of
+the real rate servers.
+"""
+rateServerUrl = os.environ.get("CALCLAB_RATE_SERVER")
+rateClient = RateClient(rateServerUrl + "/api/", rateServerUrl + "/v1/bpi/") if rateServerUrl else RateClient()
+rateProvider = LiveRateProvider(rateClient)
+
+"""Network requests run here so they never block mainloop"""
+networkExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="CalcLab network")
+
+
+class HistoryStore:
+    """
+    Calculator history in an SQLite database at path, one row per
+    calculation with its time, operation (i.e. "+", "sqrt", "expression"),
+    operands (a JSON list of exact values), result (exact), resultValue
+    (the result as a REAL, NULL if it has none, i.e. past the float range)
+    and the text shown in the history window. The REAL value of each
+    operand is in historyOperands. Rows are indexed by time and by
+    operation, so queries like recent(50, "sqrt") or today() are index
+    lookups.
+
+    write() only queues an entry; a background thread inserts the queue in
+    one transaction once maxEntries are waiting or the oldest has waited
+    maxDelay seconds, so the UI never waits for the disk. close(), also
+    run at exit, writes what is left. Ids are given out by write(), and
+    subscribers are called with (id, text) of every queued calculation,
+    in the thread that wrote it.
+
+    The history works like a ring buffer: when the database is opened and
+    then every compactInterval seconds, whether or not anything is being
+    written, the background thread rotates the oldest calculations out,
+    segmentSize at a time, until there are at most maxRows, the rows take
+    at most maxBytes and none is older than maxAge seconds (None for no
+    limit). Rotated rows are gzipped into archive (a directory, None to
+    drop them), keeping the newest maxArchives archives.
+
+    search() answers queries like "sqrt", "between 100 and 200" (results)
+    or "contains 3.14159" (operands or results) from indexes kept up to
+    date as rows are written and deleted: the operation index and the
+    indexes of resultValue and of historyOperands by value.
+    """
+
+    # AUTOINCREMENT keeps ids growing after a clear, which archive names rely on
+    table = """
+        CREATE TABLE IF NOT EXISTS {} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            time REAL NOT NULL,
+            operation TEXT NOT NULL,
+            operands TEXT NOT NULL,
+            result TEXT NOT NULL,
+            resultValue REAL,
+            text TEXT NOT NULL
+        );
+    """
+    schema = table.format("history") + """
+        CREATE INDEX IF NOT EXISTS historyTime ON history (time);
+        CREATE INDEX IF NOT EXISTS historyOperation ON history (operation, time);
+        CREATE INDEX IF NOT EXISTS historyResult ON history (resultValue);
+        CREATE TABLE IF NOT EXISTS historyOperands (
+            value REAL NOT NULL,
+            id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS historyOperandsValue ON historyOperands (value, id);
+        CREATE INDEX IF NOT EXISTS historyOperandsId ON historyOperands (id);
+        CREATE TRIGGER IF NOT EXISTS historyDeleteOperands AFTER DELETE ON history
+        BEGIN
+            DELETE FROM historyOperands WHERE id = old.id;
+        END;
+    """
+    indexVersion = 2  # user_version once resultValue and historyOperands cover every row
+    queryNumber = r"(-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+    rangeQuery = re.compile(rf"(?:results?\s+)?(?:between\s+)?{queryNumber}\s*(?:and|to|\.\.)\s*{queryNumber}")
+    containsQuery = re.compile(rf"(?:contains?\s+)?{queryNumber}")
+
+    def __init__(self, path="history.db", maxEntries=64, maxDelay=0.5, maxRows=100000, maxBytes=50 * 1024 ** 2,
+                 maxAge=None, archive="history_archive", maxArchives=20, segmentSize=1000, compactInterval=60):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.maxDelay = maxDelay
+        self.maxRows = maxRows
+        self.maxBytes = maxBytes
+        self.maxAge = maxAge
+        self.archive = archive
+        self.maxArchives = maxArchives
+        self.segmentSize = segmentSize
+        self.compactInterval = compactInterval
+        self.nextCompaction = 0
+        self.entries = []
+        self.condition = threading.Condition()
+        self.lock = threading.RLock()  # guards the connection, taken before condition
+        self.compacting = threading.Lock()  # one compaction at a time, they share the archive's temporary file
+        self.connection = None
+        self.nextId = None
+        self.subscribers = []
+        self.thread = None
+        self.closed = False
+        self.error = None
+        atexit.register(self.close)
+
+    def open(self):
+        """Return the connection, creating the database if needed. Raises sqlite3.Error if it cannot be opened."""
+        with self.lock:
+            if self.connection is None:
+                connection = sqlite3.connect(self.path, check_same_thread=False)
+                connection.row_factory = sqlite3.Row
+                connection.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a new database
+                connection.execute("PRAGMA journal_mode=WAL")
+                self.upgrade(connection)
+                connection.executescript(self.schema)
+                self.connection = connection
+                if self.nextId is None:
+                    self.nextId = max(connection.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0,
+                                      connection.execute("SELECT MAX(seq) FROM sqlite_sequence").fetchone()[0] or 0,
+                                      self.last_archived_id()) + 1
+                if connection.execute("PRAGMA user_version").fetchone()[0] < self.indexVersion:
+                    self.build_index()
+                self.start()
+            return self.connection
+
+    def start(self):
+        """Start the background thread, which compacts the history right away, unless it is running or closed."""
+        with self.condition:
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self.run, name="CalcLab history", daemon=True)
+                self.thread.start()
+
+    def upgrade(self, connection):
+        """
+        Bring a history table from an older version up to date, keeping
+        its ids: move it into one with AUTOINCREMENT, and add resultValue
+        (filled in by build_index).
+        """
+        row = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'history'").fetchone()
+        if row is None:
+            return
+        if "AUTOINCREMENT" not in row[0].upper():
+            connection.executescript("BEGIN;" + self.table.format("historyNew") +
+                                     "INSERT INTO historyNew (id, time, operation, operands, result, text) "
+                                     "SELECT id, time, operation, operands, result, text FROM history;"
+                                     "DROP TABLE history;"  # with its indexes and trigger, the schema adds them back
+                                     "ALTER TABLE historyNew RENAME TO history;"
+                                     "COMMIT;")
+        if "resultValue" not in [column[1] for column in connection.execute("PRAGMA table_info(history)")]:
+            connection.execute("ALTER TABLE history ADD COLUMN resultValue REAL")
+
+    def last_archived_id(self):
+        """The id of the newest archived calculation, 0 if there are no archives."""
+        if self.archive is None or not os.path.isdir(self.archive):
+            return 0
+        return max((int(name.split("-")[2].split(".")[0]) for name in os.listdir(self.archive)
+                    if name.startswith("history-") and name.endswith(".jsonl.gz")), default=0)
+
+    def typed(self, value):
+        """
+        The exact text and the REAL value (None if it has none) of an
+        operand or result, given as a number or as text (i.e. an
+        expression, or a number from an older version of the history).
+        """
+        if isinstance(value, str):
+            text = value.replace(",", "")
+            try:
+                number = float(text)
+            except ValueError:
+                return value, None
+        else:
+            text = formatter.plain(value)
+            if isinstance(value, FactorialResult):
+                return text, None  # past the float range
+            try:
+                number = float(value)
+            except OverflowError:
+                return text, None
+        return text, number if math.isfinite(number) else None
+
+    def rows(self, entryId, time, operation, operands, result, text):
+        """The history row and the historyOperands rows of one calculation."""
+        operands = [self.typed(operand) for operand in operands]
+        result, resultValue = self.typed(result)
+        return ((entryId, time, operation, json.dumps([operand for operand, _ in operands]), result, resultValue,
+                 text),
+                [(value, entryId) for _, value in operands if value is not None])
+
+    def build_index(self):
+        """Fill in resultValue and historyOperands for rows written by older versions, once."""
+        with self.lock:
+            connection = self.connection
+            with connection:
+                connection.execute("DROP TRIGGER IF EXISTS historyDeleteNumbers")
+                connection.execute("DROP TABLE IF EXISTS historyNumbers")
+                connection.execute("DELETE FROM historyOperands")
+                for row in connection.execute("SELECT id, operands, result FROM history").fetchall():
+                    _, resultValue = self.typed(row["result"])
+                    connection.execute("UPDATE history SET resultValue = ? WHERE id = ?", (resultValue, row["id"]))
+                    connection.executemany("INSERT INTO historyOperands (value, id) VALUES (?, ?)",
+                                           [(value, row["id"]) for value in map(lambda operand: self.typed(operand)[1],
+                                                                                json.loads(row["operands"]))
+                                            if value is not None])
+                connection.execute(f"PRAGMA user_version={self.indexVersion}")
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def write(self, operation, operands, result, text):
+        """
+        Queue one calculation and return its id. operands and result are
+        the values themselves (numbers, or text for an expression); their
+        exact text and REAL values are worked out by the writer thread.
+        """
+        if self.nextId is None:
+            self.open()
+        with self.condition:
+            entryId = self.nextId
+            self.nextId += 1
+            self.entries.append((entryId, datetime.now().timestamp(), operation, list(operands), result, text))
+            closed = self.closed
+            if not closed and len(self.entries) in (1, self.maxEntries):
+                self.condition.notify()  # the first starts the maxDelay wait; if closed, written below
+        if closed:
+            self.flush()
+        for callback in list(self.subscribers):
+            callback(entryId, text)
+        return entryId
+
+    def run(self):
+        while True:
+            if monotonic() >= self.nextCompaction:
+                self.nextCompaction = monotonic() + self.compactInterval
+                try:
+                    self.compact()
+                except (sqlite3.Error, OSError) as error:
+                    self.error = error
+                    print(f"CalcLab Error: cannot compact {self.path}: {error}", file=sys.stderr)
+            with self.condition:
+                while not self.entries and not self.closed and monotonic() < self.nextCompaction:
+                    self.condition.wait(self.nextCompaction - monotonic())
+                deadline = monotonic() + self.maxDelay
+                while (self.entries and len(self.entries) < self.maxEntries and not self.closed and
+                       monotonic() < deadline):
+                    self.condition.wait(deadline - monotonic())
+                closed = self.closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        """Write every queued entry now."""
+        with self.lock:
+            with self.condition:
+                batch, self.entries = self.entries, []
+            if not batch:
+                return
+            rows = [self.rows(*entry) for entry in batch]
+            try:
+                with self.open() as connection:
+                    connection.executemany("INSERT INTO history (id, time, operation, operands, result, resultValue, "
+                                           "text) VALUES (?, ?, ?, ?, ?, ?, ?)", [row for row, _ in rows])
+                    connection.executemany("INSERT INTO historyOperands (value, id) VALUES (?, ?)",
+                                           itertools.chain.from_iterable(operands for _, operands in rows))
+            except sqlite3.Error as error:
+                self.error = error
+                print(f"CalcLab Error: cannot write {self.path}: {error}", file=sys.stderr)
+
+    def query(self, sql, parameters=()):
+        """Run a query on the history, queued entries included, and return its rows."""
+        self.flush()
+        with self.lock:
+            return self.open().execute(sql, parameters).fetchall()
+
+    def recent(self, limit=50, operation=None):
+        """The last limit calculations, newest first, optionally only of one operation."""
+        if operation is None:
+            return self.query("SELECT * FROM history ORDER BY time DESC, id DESC LIMIT ?", (limit,))
+        return self.query("SELECT * FROM history WHERE operation = ? ORDER BY time DESC, id DESC LIMIT ?",
+                          (operation, limit))
+
+    def between(self, start, end=None):
+        """Calculations from start up to end (timestamps or datetimes), oldest first."""
+        start = start.timestamp() if isinstance(start, datetime) else start
+        end = math.inf if end is None else end.timestamp() if isinstance(end, datetime) else end
+        return self.query("SELECT * FROM history WHERE time >= ? AND time < ? ORDER BY time, id", (start, end))
+
+    def today(self):
+        return self.between(datetime.combine(datetime.today().date(), datetime.min.time()))
+
+    def older(self, beforeId=None, limit=200):
+        """The (id, text) of up to limit calculations before beforeId (or the newest), newest first."""
+        if beforeId is None:
+            return self.query("SELECT id, text FROM history ORDER BY id DESC LIMIT ?", (limit,))
+        return self.query("SELECT id, text FROM history WHERE id < ? ORDER BY id DESC LIMIT ?", (beforeId, limit))
+
+    def newer(self, afterId, limit=200):
+        """The (id, text) of up to limit calculations after afterId, oldest first."""
+        return self.query("SELECT id, text FROM history WHERE id > ? ORDER BY id LIMIT ?", (afterId, limit))
+
+    def count(self):
+        return self.query("SELECT COUNT(*) FROM history")[0][0]
+
+    def matching_numbers(self, low, high, limit, operands=False):
+        """
+        The (id, text, value) of up to limit calculations with a result,
+        or an operand if operands is set, in [low, high), by that value.
+        Reading the indexes in order, the queries stop after limit matches
+        however many there are.
+        """
+        rows = self.query("SELECT id, text, resultValue AS value FROM history "
+                          "WHERE resultValue >= ? AND resultValue < ? ORDER BY resultValue LIMIT ?",
+                          (low, high, limit))
+        if operands:
+            rows = heapq.merge(rows, self.query("SELECT history.id, history.text, historyOperands.value "
+                                                "FROM historyOperands JOIN history ON history.id = historyOperands.id "
+                                                "WHERE historyOperands.value >= ? AND historyOperands.value < ? "
+                                                "ORDER BY historyOperands.value LIMIT ?", (low, high, limit)),
+                               key=lambda row: row["value"])
+        matches = {}
+        for row in rows:
+            matches.setdefault(row["id"], row)  # once each, where its first value matched
+            if len(matches) == limit:
+                break
+        return list(matches.values())
+
+    def search(self, text, limit=200):
+        """
+        The (id, text) of up to limit calculations matching text. Queries
+        are a range of results ("between 100 and 200", "results 100 to
+        200", "100..200", bounds included) or a number an operand or the
+        result starts with ("contains 3.14159", "3,000"), both ordered
+        by the matching number, or an operation ("sqrt", "+"), newest
+        first. Anything else is looked for in the history text, newest
+        first, which has no index and reads the table until it has limit.
+        """
+        text = " ".join(text.lower().split())
+        if not text:
+            return []
+        numbers = text.replace(",", "")  # numbers are shown with thousands separators
+        match = self.rangeQuery.fullmatch(numbers)
+        if match:
+            low, high = sorted(float(number) for number in match.groups())
+            return self.matching_numbers(low, math.nextafter(high, math.inf), limit)
+        match = self.containsQuery.fullmatch(numbers)
+        if match:
+            """
+            Numbers with these leading digits, i.e. 3.14159 matches
+            3.14159 up to 3.1415999..., and -2 matches -2 down to -2.999...
+            """
+            number = match.group(1)
+            mantissa, _, exponent = number.lower().partition("e")
+            decimals = len(mantissa.partition(".")[2])
+            try:
+                step = 10.0 ** (int(exponent or 0) - decimals)
+            except OverflowError:
+                return []  # past the largest float, no calculation has it
+            low = float(number)
+            if number.startswith("-"):
+                return self.matching_numbers(math.nextafter(low - step, math.inf), math.nextafter(low, math.inf),
+                                             limit, operands=True)
+            return self.matching_numbers(low, low + step, limit, operands=True)
+        rows = self.query("SELECT id, text FROM history WHERE operation = ? ORDER BY time DESC, id DESC LIMIT ?",
+                          (text, limit))
+        if rows:
+            return rows
+        return self.query("SELECT id, text FROM history WHERE text LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?",
+                          ("%" + re.sub(r"([%_\\])", r"\\\1", text) + "%", limit))
+
+    def expired_before(self, connection):
+        """The first id within the limits (all older rows are past them), or None if all rows are."""
+        count, lastId = connection.execute("SELECT COUNT(*), MAX(id) FROM history").fetchone()
+        if not count:
+            return None
+        excess = 0
+        if self.maxRows is not None:
+            excess = max(excess, count - self.maxRows)
+        if self.maxBytes is not None:
+            pageSize, pages, freePages = (connection.execute(f"PRAGMA {name}").fetchone()[0]
+                                          for name in ("page_size", "page_count", "freelist_count"))
+            size = (pages - freePages) * pageSize
+            if size > self.maxBytes:
+                excess = max(excess, math.ceil((size - self.maxBytes) * count / size))
+        cutoffs = []
+        if excess:
+            row = connection.execute("SELECT id FROM history ORDER BY id LIMIT 1 OFFSET ?", (excess,)).fetchone()
+            cutoffs.append(row[0] if row else lastId + 1)
+        if self.maxAge is not None:
+            row = connection.execute("SELECT MIN(id) FROM history WHERE time >= ?",
+                                     (datetime.now().timestamp() - self.maxAge,)).fetchone()
+            cutoffs.append(lastId + 1 if row[0] is None else row[0])
+        return max(cutoffs) if cutoffs else None
+
+    def compact(self):
+        """
+        Rotate out every calculation past the limits, a segment at a time so
+        readers are only held up for one segment, archiving them if archive
+        is set, after any compaction already running. Returns the number
+        of rows rotated out.
+        """
+        with self.compacting:
+            removed = 0
+            archive = None
+            firstId = lastId = None
+            try:
+                while True:
+                    with self.lock:
+                        connection = self.open()
+                        cutoff = self.expired_before(connection)
+                        if cutoff is None:
+                            break
+                        rows = connection.execute("SELECT * FROM history WHERE id < ? ORDER BY id LIMIT ?",
+                                                  (cutoff, self.segmentSize)).fetchall()
+                        if not rows:
+                            break
+                        if self.archive is not None:
+                            if archive is None:
+                                os.makedirs(self.archive, exist_ok=True)
+                                archive = gzip.open(os.path.join(self.archive, "history.jsonl.gz.tmp"), "wt")
+                                firstId = rows[0]["id"]
+                            archive.writelines(json.dumps(dict(row)) + "\n" for row in rows)
+                        lastId = rows[-1]["id"]
+                        with connection:
+                            connection.execute("DELETE FROM history WHERE id <= ?", (lastId,))
+                        removed += len(rows)
+            finally:
+                if archive is not None:
+                    archive.close()
+                    os.replace(os.path.join(self.archive, "history.jsonl.gz.tmp"),
+                               os.path.join(self.archive, f"history-{firstId:012d}-{lastId:012d}.jsonl.gz"))
+            if removed:
+                with self.lock:
+                    self.connection.executescript("PRAGMA incremental_vacuum")  # runs it to completion
+                    self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self.prune_archives()
+            return removed
+
+    def prune_archives(self):
+        """Delete all but the newest maxArchives archives."""
+        if self.archive is None or not os.path.isdir(self.archive):
+            return
+        archives = sorted(name for name in os.listdir(self.archive)
+                          if name.startswith("history-") and name.endswith(".jsonl.gz"))
+        for name in archives[:max(len(archives) - self.maxArchives, 0)]:
+            os.remove(os.path.join(self.archive, name))
+
+    def clear(self, before=None):
+        """Delete all history, queued entries included, or only what is older than before (a timestamp or datetime)."""
+        if before is not None:
+            before = before.timestamp() if isinstance(before, datetime) else before
+            self.flush()
+            with self.lock:
+                with self.open() as connection:
+                    connection.execute("DELETE FROM history WHERE time < ?", (before,))
+            return None
+        with self.lock:
+            with self.condition:
+                self.entries.clear()
+            with self.open() as connection:
+                connection.execute("DELETE FROM history")
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+historyStore = HistoryStore()
+
 
 class CalcLab(tk.Tk):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, lazy=True, prebuild=False, **kwargs):
         tk.Tk.__init__(self, *args, **kwargs)
         """
         This container is where all the frames (or pages) will be stacked
         on top of each other, then each one that we want visible will be
         raised above the others.
         """
-        container = tk.Frame(self)
-        container.pack(side="top", fill="both", expand=True)
-        container.grid_rowconfigure(0, weight=1)
-        container.grid_columnconfigure(0, weight=1)
+        self.container = tk.Frame(self)
+        self.container.pack(side="top", fill="both", expand=True)
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
 
-        classList = []
+        """
+        Pages are registered as factories and only built the first time
+        show_frame asks for them, so startup costs about as much as the
+        first page. With lazy=False every page is built up front, and
+        with prebuild=True the remaining pages are built one at a time
+        whenever the app is idle.
+        """
+        self.factories = {}
         self.frames = {}
+        self.currentPage = None
         for element in pages:
-            classList.append(self.str_to_class(element))
-        for frame in classList:
-            page_name = frame.__name__
-            frame = frame(parent=container, controller=self)
-            self.frames[page_name] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
+            self.factories[element] = self.str_to_class(element)
+        if not lazy:
+            for page_name in self.factories:
+                self.get_frame(page_name)
 
         """
         Show the first page based on the first element in the pages list.
         """
         self.show_frame(pages[0])
+        if prebuild:
+            self.after_idle(self.prebuild)
 
-        """Clear all history in history.txt"""
+        """History is kept between launches, check that it can be opened"""
         try:
-            open("history.txt", "w").close()
-        except PermissionError:
+            historyStore.open()
+        except (sqlite3.Error, OSError):
             tk.messagebox.showerror("CalcLab Error", "An error occurred:\nCannot access" +
-                                    " history.txt\n\nIt may be set to " +
+                                    " history.db\n\nIt may be set to " +
                                     "read-only or you might not have\n" +
                                     "enough disk space.")
             sys.exit(1)
 
+    def get_frame(self, page_name):
+        """Return the page, building it on first use."""
+        frame = self.frames.get(page_name)
+        if frame is None:
+            frame = self.factories[page_name](parent=self.container, controller=self)
+            self.frames[page_name] = frame
+            frame.grid(row=0, column=0, sticky="nsew")
+            # keep the page on screen on top of the newly built one
+            if self.currentPage is not None:
+                self.currentPage.tkraise()
+        return frame
+
+    def prebuild(self):
+        """Build the next page that has not been built yet, then wait for the next idle time."""
+        for page_name in self.factories:
+            if page_name not in self.frames:
+                self.get_frame(page_name)
+                self.after_idle(self.prebuild)
+                return
+
     def show_frame(self, page_name):
-        frame = self.frames[page_name]
+        frame = self.get_frame(page_name)
+        # stop the background work of the page we are leaving
+        try:
+            if self.currentPage is not frame:
+                self.currentPage.cancel_task()
+        except AttributeError:
+            pass
+        self.currentPage = frame
         frame.tkraise()
         # reset answer field and various text to default after changing page
         try:
@@ -360,29 +2664,28 @@ class AnswerField:
             elif char != 0:
                 self.text.insert(tk.END, char)
 
-    def set_value(self, value):
+    def set_value(self, value, previous=None):
+        """
+        Show value, flashing the field if it does not change: if it equals
+        previous (the value that was shown, when the caller has it) or
+        else the text that is shown. The field is never evaluated again.
+        """
         try:
-            int(value)
-            float(value)
-        except (NameError, SyntaxError, ValueError, OverflowError):
+            text = formatter.format(value)
+            isFraction = not isinstance(value, FactorialResult) and value % 1 != 0
+        except (TypeError, ValueError, OverflowError):
             self.text.delete(0, tk.END)
             self.text.insert(0, "Error")
             return 1
-        if value % 1 == 0:
-            value = int(value)
-        if value == AnswerField.get_value(self):
+        if value == previous if previous is not None else text == self.text.get():
             self.text.config(fg="#000000")
             self.after(100, lambda: self.text.config(fg="#FFFFFF"))
-        if "." in str(value):
+        if isFraction:
             self.dotButton["state"] = "disabled"
         else:
             self.dotButton["state"] = "normal"
         self.text.delete(0, tk.END)
-        if len(str(int(value))) <= 18 and len(self.text.get()) <= 18:
-            self.text.insert(0,
-                             f"{round(value, 18 - len(str(int(value)))):,}")
-        else:
-            self.text.insert(0, f"{round(value, 12):e}")
+        self.text.insert(0, text)
 
     def negative(self):
         try:
@@ -411,7 +2714,7 @@ class AnswerField:
 
     def get_value(self):
         try:
-            self.__value = eval(self.text.get().replace(',', ''))
+            self.__value = evaluator.evaluate(self.text.get())
         except (NameError, SyntaxError, ValueError, OverflowError):
             self.text.delete(0, tk.END)
             self.text.insert(0, "Error")
@@ -551,6 +2854,196 @@ class VerticalScrolledFrame(tk.Frame):
         canvas.bind('<Configure>', _configure_canvas)
 
 
+class HistoryText(tk.Text):
+    """
+    Text box of the calculation history, newest at the bottom, which only
+    holds a window of at most maxLines calculations. It opens on the
+    newest block, then loads older or newer blocks of blockSize from the
+    store as the user scrolls near the top or bottom, dropping lines at
+    the other end, so opening it is as fast for any size of history.
+    show_results() swaps the window for a fixed list of search results
+    until load_tail() goes back to it.
+    """
+
+    emptyText = ("There is no history yet.\n\nTip:\nYou can copy numbers " +
+                 "from here\nand paste them into the app's\nanswer field.")
+    noResultsText = "No calculation matches."
+
+    def __init__(self, parent, store, scrollbar, blockSize=200, maxLines=1000, **kwargs):
+        tk.Text.__init__(self, parent, yscrollcommand=self.on_scroll, **kwargs)
+        self.store = store
+        self.scrollbar = scrollbar
+        self.blockSize = blockSize
+        self.maxLines = maxLines
+        self.ids = []  # id of the calculation on each line
+        self.atStart = self.atEnd = True
+        self.loading = False
+        self.searching = False
+        self.load_tail()
+
+    def load_tail(self):
+        """Show the newest block. Returns False if there is no history."""
+        self.delete("1.0", tk.END)
+        self.searching = False
+        rows = self.store.older(None, self.blockSize)[::-1]
+        self.ids = [row["id"] for row in rows]
+        self.atStart = len(rows) < self.blockSize
+        self.atEnd = True
+        self.insert(tk.END, "\n".join(row["text"] for row in rows) if rows else self.emptyText)
+        self.yview(tk.END)
+        return bool(rows)
+
+    def show_results(self, rows):
+        """Show search results in the order search() returns them."""
+        self.delete("1.0", tk.END)
+        self.searching = True
+        self.ids = [row["id"] for row in rows]
+        self.insert(tk.END, "\n".join(row["text"] for row in rows) if rows else self.noResultsText)
+        self.yview("1.0")
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.loading or self.searching or not self.ids:
+            return None
+        if float(first) < 0.1 and not self.atStart:
+            self.loading = True
+            self.after_idle(self.load_older)
+        elif float(last) > 0.9 and not self.atEnd:
+            self.loading = True
+            self.after_idle(self.load_newer)
+
+    def append_entry(self, entryId, text):
+        """Show a new calculation if the newest ones are loaded, following it if the view is at the bottom."""
+        if not self.atEnd or self.searching:
+            return None
+        following = self.yview()[1] >= 1.0
+        if self.ids:
+            self.insert(tk.END, "\n" + text)
+        else:
+            self.delete("1.0", tk.END)
+            self.insert(tk.END, text)
+        self.ids.append(entryId)
+        if len(self.ids) > self.maxLines:
+            self.delete("1.0", "2.0")
+            del self.ids[0]
+            self.atStart = False
+        if following:
+            self.yview(tk.END)
+
+    def top_line(self):
+        return int(self.index("@0,0").split(".")[0])
+
+    def load_older(self):
+        rows = self.store.older(self.ids[0], self.blockSize) if self.ids else []
+        self.atStart = len(rows) < self.blockSize
+        if rows:
+            top = self.top_line()
+            self.insert("1.0", "".join(row["text"] + "\n" for row in reversed(rows)))
+            self.ids[:0] = [row["id"] for row in reversed(rows)]
+            extra = len(self.ids) - self.maxLines
+            if extra > 0:
+                self.delete(f"{len(self.ids) - extra}.end", tk.END)
+                del self.ids[-extra:]
+                self.atEnd = False
+            self.yview(f"{top + len(rows)}.0")
+        self.loading = False
+
+    def load_newer(self):
+        rows = self.store.newer(self.ids[-1], self.blockSize) if self.ids else []
+        self.atEnd = len(rows) < self.blockSize
+        if rows:
+            top = self.top_line()
+            self.insert(tk.END, "".join("\n" + row["text"] for row in rows))
+            self.ids.extend(row["id"] for row in rows)
+            extra = len(self.ids) - self.maxLines
+            if extra > 0:
+                self.delete("1.0", f"{extra + 1}.0")
+                del self.ids[:extra]
+                self.atStart = False
+                self.yview(f"{max(top - extra, 1)}.0")
+        self.loading = False
+
+
+class HistoryWindow(tk.Toplevel):
+    """
+    History window, created once and only hidden when closed. It
+    subscribes to the store, so new calculations appear in it as they
+    happen, open or not. Typing in the search box filters the history
+    with store.search() once typing pauses for searchDelay milliseconds.
+    """
+
+    searchDelay = 150
+
+    def __init__(self, parent, store):
+        tk.Toplevel.__init__(self, parent)
+        self.store = store
+        self.title("History")
+        self.geometry("420x720")
+        self.minsize(420, 720)
+        self.maxsize(1024, 720)
+        self.configure(bg="#000000")
+        self.protocol("WM_DELETE_WINDOW", self.withdraw)
+        self.searchJob = None
+        self.searchText = tk.StringVar()
+        self.searchBox = tk.Entry(self, textvariable=self.searchText, font=("Arial", 18), bg="#505050",
+                                  fg="#FFFFFF", insertbackground="#FFFFFF", bd=0)
+        self.searchBox.pack(side="top", fill="x", padx=10, pady=(10, 0))
+        self.searchBox.bind("<KeyRelease>", self.schedule_search)
+        self.searchBox.bind("<Escape>", lambda event: self.searchText.set(""))
+        v = tk.Scrollbar(self)
+        h = tk.Scrollbar(self, orient="horizontal")
+        v.pack(side="right", fill="y")
+        h.pack(side="bottom", fill="x")
+        self.clearButton = tk.Button(self, text="🗑", height=1, font=("Arial", 18), bg="#FF9500", fg="#FFFFFF",
+                                     activebackground="#FF9500", activeforeground="#FFFFFF", bd=0,
+                                     command=self.clear)
+        self.textBox = HistoryText(self, store, v, height=19, bg="#000000", fg="#FFFFFF",
+                                   insertbackground="#FFFFFF", selectbackground="#505050", bd=0,
+                                   font=("Arial", 18), wrap="none", spacing3=3)
+        self.textBox.pack(anchor="w", padx=10, pady=10)
+        if self.textBox.ids:
+            self.show_clear_button()
+        h.config(command=self.textBox.xview)
+        v.config(command=self.textBox.yview)
+        store.subscribe(self.add_entry)
+
+    def show(self):
+        self.deiconify()
+        self.lift()
+        self.focus_force()
+
+    def add_entry(self, entryId, text):
+        self.textBox.append_entry(entryId, text)
+        self.show_clear_button()
+
+    def schedule_search(self, event=None):
+        if self.searchJob is not None:
+            self.after_cancel(self.searchJob)
+        self.searchJob = self.after(self.searchDelay, self.search)
+
+    def search(self):
+        self.searchJob = None
+        query = self.searchText.get().strip()
+        if query:
+            self.textBox.show_results(self.store.search(query))
+        elif self.textBox.searching:
+            self.textBox.load_tail()
+
+    def show_clear_button(self):
+        if not self.clearButton.winfo_manager():
+            self.clearButton.pack(side="bottom", anchor="e", padx=10, pady=5, before=self.textBox)
+
+    def clear(self):
+        self.store.clear()
+        self.searchText.set("")
+        self.textBox.load_tail()
+        self.clearButton.pack_forget()
+
+    def destroy(self):
+        self.store.unsubscribe(self.add_entry)
+        tk.Toplevel.destroy(self)
+
+
 class SelectionMenu(tk.Frame):
     """
     Initializing tools selection menu and putting buttons into the
@@ -565,10 +3058,9 @@ class SelectionMenu(tk.Frame):
         scrollFrame = VerticalScrolledFrame(self)
         scrollFrame.pack(fill="both", expand=True)
 
-        # Remove selection menu button from the
-        # list since user is already in that page
-        pages.remove("SelectionMenu")
-        pageList = pages
+        # Leave out the selection menu button
+        # since user is already in that page
+        pageList = [page for page in pages if page != "SelectionMenu"]
         for index, page in enumerate(pageList):
             spacedText = ""
             for i, letter in enumerate(page):
@@ -596,14 +3088,18 @@ class Calculator(tk.Frame, UpdateNumber):
         Frame.set_header_text(self, "Calculator")
         SelectionButton.summon(self, controller)
 
-        self.__value = 0
-        self.__memory = 0
-        self.__reVal = 0
+        self.engine = CalculatorEngine()
+        self.budget = EvaluationBudget()
+        self.task = None
+        self.historyWindow = None
+        self.__pendingText = ""
+        self.__exactResult = None
+        self.__exactText = None
         self.__lockSecInput = False
         self.__lockOperatorInput = False
-        self.__operator = None
 
         AnswerField.summon(self, 2, 8)
+        self.text.bind("<<Copy>>", self.copy_exact)
 
         self.graphButton = tk.Button(self, text="📈", bg="#1C1C1C", fg="#FFFFFF", bd=0, font=("Arial", 18), width=3,
                                      activebackground="#767676", activeforeground="#FFFFFF", command=self.plot_graph
@@ -724,6 +3220,7 @@ class Calculator(tk.Frame, UpdateNumber):
         self.equalButton.grid(row=7, column=7)
 
     def update(self, char):
+        self.cancel_task()
         self.__lockOperatorInput = False
         if self.__lockSecInput:
             self.dotButton["state"] = "normal"
@@ -737,362 +3234,277 @@ class Calculator(tk.Frame, UpdateNumber):
         AnswerField.update(self, char)
 
     def negative(self):
+        self.cancel_task()
         AnswerField.negative(self)
 
     def clear(self):
+        self.cancel_task()
         self.plusButton.config(bg="#FF9500", fg="#FFFFFF")
         self.minusButton.config(bg="#FF9500", fg="#FFFFFF")
         self.multiplyButton.config(bg="#FF9500", fg="#FFFFFF")
         self.divideButton.config(bg="#FF9500", fg="#FFFFFF")
-        self.__memory = 0
-        self.__reVal = 0
+        self.engine.clear()
         self.__lockOperatorInput = True
-        self.__operator = None
         AnswerField.clear(self)
 
     def delete(self):
+        self.cancel_task()
         if not self.__lockOperatorInput:
             AnswerField.delete(self)
 
     def equal(self):
+        self.cancel_task()
         self.__lockOperatorInput = True
         self.plusButton.config(bg="#FF9500", fg="#FFFFFF")
         self.minusButton.config(bg="#FF9500", fg="#FFFFFF")
         self.multiplyButton.config(bg="#FF9500", fg="#FFFFFF")
         self.divideButton.config(bg="#FF9500", fg="#FFFFFF")
         self.__displayedText = self.text.get().replace(',', '')
-        history = open("history.txt", "a")
         try:
-            float(self.__memory)
+            digits = evaluator.estimate(self.__displayedText)
+        except:
+            self.display_error()
+            return 1
+        return self.run_bounded(digits, self.equal_value, evaluate_expression, self.__displayedText)
+
+    def equal_value(self, value):
+        try:
             float(self.__displayedText)
         except ValueError:
-            try:
-                float(self.__memory)
-                history.write(f"{self.text.get()} = {eval(self.text.get())}\n")
-                self.set_text(eval(self.text.get()))
-            except:
-                self.display_error()
-                return 1
-        if self.__operator is not None:
-            if self.__operator == "+":
-                if self.__reVal == 0:
-                    self.__value = eval(str(self.__memory)) + eval(str(self.__displayedText))
-                    self.__reVal = eval(str(self.__displayedText))
-                else:
-                    self.__value += self.__reVal
-            elif self.__operator == "-":
-                if self.__reVal == 0:
-                    self.__value = float(self.__memory) - float(self.__displayedText)
-                    self.__reVal = float(self.__displayedText)
-                else:
-                    self.__value -= self.__reVal
-            elif self.__operator == "*":
-                if self.__reVal == 0:
-                    self.__value = float(self.__memory) * float(self.__displayedText)
-                    self.__reVal = float(self.__displayedText)
-                else:
-                    self.__value *= self.__reVal
-            elif self.__operator == "/":
-                try:
-                    float(self.__memory) / float(self.__displayedText)
-                except ZeroDivisionError:
-                    self.display_error()
-                    return 1
-                if self.__reVal == 0:
-                    self.__value = float(self.__memory) / float(self.__displayedText)
-                    self.__reVal = float(self.__displayedText)
-                else:
-                    self.__value /= self.__reVal
-            self.__lockSecInput = True
-            self.set_text(self.__value)
-            if self.__operator is not None:
-                history.write(f"{self.__memory} {self.__operator} {eval(self.__displayedText)} = {self.text.get()}\n")
-            history.close()
+            # The answer field contains an expression (i.e. pasted "2+3")
+            self.set_text(value, value)
+            historyStore.write("expression", [self.__displayedText], value,
+                               f"{self.__displayedText} = {self.text.get()}")
+            if self.engine.operator is None:
+                return None
+        if self.engine.operator is not None:
+            left, right = self.engine.operands(value)
+            return self.run_bounded(self.engine.magnitude(self.engine.operator, left, right),
+                                    lambda result: self.show_equal(value, left, right, result),
+                                    self.engine.operations[self.engine.operator], left, right)
+
+    def show_equal(self, value, left, right, result):
+        self.engine.store(left, right, result)
+        self.__lockSecInput = True
+        self.set_text(result, value)
+        resultText = self.exact_text(result)
+        left, operator, right = self.engine.expression
+        historyStore.write(operator, [left, right], result,
+                           f"{formatter.plain(left)} {operator} {formatter.plain(right)} = {resultText}")
 
-    def set_text(self, value):
-        AnswerField.set_value(self, value)
+    def set_text(self, value, previous=None):
+        AnswerField.set_value(self, value, previous)
 
     def display_error(self):
         self.text.delete(0, tk.END)
         self.text.insert(0, "Error")
 
+    def display_overflow(self):
+        self.text.delete(0, tk.END)
+        self.text.insert(0, "Overflow")
+
     def add(self):
-        if not self.__lockOperatorInput:
-            self.equal()
-        self.plusButton.config(bg="#FFFFFF", fg="#FF9500", activebackground="#FFFFFF", activeforeground="#FF9500")
-        self.minusButton.config(bg="#FF9500", fg="#FFFFFF")
-        self.multiplyButton.config(bg="#FF9500", fg="#FFFFFF")
-        self.divideButton.config(bg="#FF9500", fg="#FFFFFF")
-        try:
-            self.__memory = eval(self.text.get().replace(',', ''))
-        except (NameError, SyntaxError, ValueError, OverflowError):
-            self.display_error()
-            return 1
-        self.__reVal = 0
-        self.__lockOperatorInput = True
-        self.__lockSecInput = True
-        self.__operator = "+"
-        self.dotButton["state"] = "normal"
+        return self.set_operator("+", self.plusButton)
 
     def minus(self):
-        if not self.__lockOperatorInput:
-            self.equal()
-        self.plusButton.config(bg="#FF9500", fg="#FFFFFF")
-        self.minusButton.config(bg="#FFFFFF", fg="#FF9500", activebackground="#FFFFFF", activeforeground="#FF9500")
-        self.multiplyButton.config(bg="#FF9500", fg="#FFFFFF")
-        self.divideButton.config(bg="#FF9500", fg="#FFFFFF")
-        try:
-            self.__memory = self.text.get().replace(',', '')
-        except (NameError, SyntaxError, ValueError, OverflowError):
-            self.display_error()
-            return 1
-        self.__reVal = 0
-        self.__lockOperatorInput = True
-        self.__lockSecInput = True
-        self.__operator = "-"
-        self.dotButton["state"] = "normal"
+        return self.set_operator("-", self.minusButton)
 
     def multiply(self):
-        if not self.__lockOperatorInput:
-            self.equal()
-        self.plusButton.config(bg="#FF9500", fg="#FFFFFF")
-        self.minusButton.config(bg="#FF9500", fg="#FFFFFF")
-        self.multiplyButton.config(bg="#FFFFFF", fg="#FF9500", activebackground="#FFFFFF", activeforeground="#FF9500")
-        self.divideButton.config(bg="#FF9500", fg="#FFFFFF")
-        try:
-            self.__memory = self.text.get().replace(',', '')
-        except (NameError, SyntaxError, ValueError, OverflowError):
-            self.display_error()
-            return 1
-        self.__reVal = 0
-        self.__lockOperatorInput = True
-        self.__lockSecInput = True
-        self.__operator = "*"
-        self.dotButton["state"] = "normal"
+        return self.set_operator("*", self.multiplyButton)
 
     def divide(self):
+        return self.set_operator("/", self.divideButton)
+
+    def set_operator(self, operator, button):
         if not self.__lockOperatorInput:
             self.equal()
+        if self.task is not None:
+            # wait for the pending calculation, its result becomes the memory
+            self.after(50, self.set_operator, operator, button)
+            return None
         self.plusButton.config(bg="#FF9500", fg="#FFFFFF")
         self.minusButton.config(bg="#FF9500", fg="#FFFFFF")
         self.multiplyButton.config(bg="#FF9500", fg="#FFFFFF")
-        self.divideButton.config(bg="#FFFFFF", fg="#FF9500", activebackground="#FFFFFF", activeforeground="#FF9500")
+        self.divideButton.config(bg="#FF9500", fg="#FFFFFF")
+        button.config(bg="#FFFFFF", fg="#FF9500", activebackground="#FFFFFF", activeforeground="#FF9500")
+        text = self.text.get()
         try:
-            self.__memory = self.text.get().replace(',', '')
+            digits = evaluator.estimate(text)
         except:
             self.display_error()
             return 1
-        self.__reVal = 0
+        return self.run_bounded(digits, lambda value: self.store_operator(operator, value), evaluate_expression, text)
+
+    def store_operator(self, operator, value):
+        self.engine.set_operator(operator, value)
         self.__lockOperatorInput = True
         self.__lockSecInput = True
-        self.__operator = "/"
         self.dotButton["state"] = "normal"
 
-    def percent(self):
+    def apply(self, operation, historyFormat=None):
+        """
+        Apply a single-operand engine operation to the displayed value,
+        then show the result and store it in history.
+        """
+        text = self.text.get()
+        onResult = lambda result: self.show_result(operation.__name__, historyFormat, *result)
         try:
-            self.set_text(eval(self.text.get().replace(',', '')) / 100)
+            digits = evaluator.estimate(text)
+            inline = self.budget.check(digits)
+            if inline:
+                # cheap enough to evaluate here to size the result, and it is not evaluated again
+                value = evaluator.evaluate(text)
+                digits = max(digits, self.engine.magnitude(operation.__name__, value))
+        except OverflowError:
+            self.display_overflow()
+            return 1
         except:
             self.display_error()
             return 1
+        if inline:
+            return self.run_bounded(digits, onResult, apply_value, operation, value)
+        return self.run_bounded(digits, onResult, apply_operation, operation, text)
+
+    def show_result(self, operation, historyFormat, value, result):
+        self.set_text(result, value)
+        resultText = self.exact_text(result)
+        if historyFormat is not None:
+            historyStore.write(operation, [value], result,
+                               f"{historyFormat.format(formatter.plain(value))} = {resultText}")
+
+    def exact_text(self, result):
+        """
+        The history text of a result just shown: the exact digits of an
+        integer shown in scientific notation (which copy_exact then copies
+        too), otherwise the display.
+        """
+        text = self.text.get()
+        if not isinstance(result, (int, FactorialResult)) or "e" not in text:
+            return text
+        self.__exactResult = result
+        self.__exactText = text
+        return formatter.plain(result)  # exact digits are only computed here
+
+    def copy_exact(self, event):
+        """Copy the exact digits of an integer shown in scientific notation instead of its display."""
+        if self.__exactResult is None or self.text.get() != self.__exactText:
+            return None
+        self.clipboard_clear()
+        self.clipboard_append(formatter.exact(self.__exactResult, factorials.copyDigits))
+        return "break"
 
-    def square(self):
+    def run_bounded(self, digits, onResult, function, *args):
+        """
+        Run function(*args) within the evaluation budget and pass its result
+        to onResult. Cheap work runs inline; expensive work runs in a worker
+        process polled with after(), so mainloop never blocks; anything over
+        budget shows Overflow instead.
+        """
         try:
-            eval(self.text.get().replace(',', ''))**2
-        except:
-            self.display_error()
+            inline = self.budget.check(digits)
+        except OverflowError:
+            self.display_overflow()
             return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(value**2)
-        history = open("history.txt", "a")
-        history.write(f"({value})^2 = {self.text.get()}\n")
-        history.close()
+        if inline:
+            try:
+                result = function(*args)
+            except OverflowError:
+                self.display_overflow()
+                return 1
+            except:
+                self.display_error()
+                return 1
+            return onResult(result)
+        self.cancel_task()
+        self.task = self.budget.start(function, *args)
+        self.__pendingText = self.text.get()
+        self.text.delete(0, tk.END)
+        self.text.insert(0, "Calculating...")
+        self.after(50, self.poll_task, self.task, onResult)
 
-    def cube(self):
+    def poll_task(self, task, onResult):
+        if task is not self.task:  # cancelled
+            return None
         try:
-            eval(self.text.get().replace(',', ''))**3
+            done, result = task.poll()
+        except (OverflowError, MemoryError):
+            self.task = None
+            self.display_overflow()
+            return 1
         except:
+            self.task = None
             self.display_error()
             return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(value**3)
-        history = open("history.txt", "a")
-        history.write(f"({value})^3 = {self.text.get()}\n")
-        history.close()
+        if not done:
+            self.after(50, self.poll_task, task, onResult)
+            return None
+        self.task = None
+        self.text.delete(0, tk.END)
+        self.text.insert(0, self.__pendingText)
+        onResult(result)
+
+    def cancel_task(self):
+        """Stop the pending calculation, if any, and put its input back in the answer field."""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.text.delete(0, tk.END)
+            self.text.insert(0, self.__pendingText)
+
+    def percent(self):
+        return self.apply(self.engine.percent)
+
+    def square(self):
+        return self.apply(self.engine.square, "({})^2")
+
+    def cube(self):
+        return self.apply(self.engine.cube, "({})^3")
 
     def sqrt(self):
-        try:
-            math.sqrt(eval(self.text.get().replace(',', '')))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.sqrt(value))
-        history = open("history.txt", "a")
-        history.write(f"sqrt({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.sqrt, "sqrt({})")
 
     def cbrt(self):
-        try:
-            numpy.cbrt(eval(self.text.get().replace(',', '')))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(numpy.cbrt(value))
-        history = open("history.txt", "a")
-        history.write(f"cbrt({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.cbrt, "cbrt({})")
 
     def sin(self):
-        try:
-            math.sin(math.radians(eval(self.text.get().replace(',', ''))))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.sin(math.radians(value)))
-        history = open("history.txt", "a")
-        history.write(f"sin({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.sin, "sin({})")
 
     def cos(self):
-        try:
-            math.cos(math.radians(eval(self.text.get().replace(',', ''))))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.cos(math.radians(value)))
-        history = open("history.txt", "a")
-        history.write(f"cos({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.cos, "cos({})")
 
     def tan(self):
-        try:
-            math.tan(math.radians(eval(self.text.get().replace(',', ''))))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.tan(math.radians(value)))
-        history = open("history.txt", "a")
-        history.write(f"tan({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.tan, "tan({})")
 
     def sinh(self):
-        try:
-            math.sinh(eval(self.text.get().replace(',', '')))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.sinh(value))
-        history = open("history.txt", "a")
-        history.write(f"sinh({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.sinh, "sinh({})")
 
     def cosh(self):
-        try:
-            math.cosh(eval(self.text.get().replace(',', '')))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.cosh(value))
-        history = open("history.txt", "a")
-        history.write(f"cosh({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.cosh, "cosh({})")
 
     def tanh(self):
-        try:
-            math.tanh(eval(self.text.get().replace(',', '')))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.tanh(value))
-        history = open("history.txt", "a")
-        history.write(f"tanh({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.tanh, "tanh({})")
 
     def ln(self):
-        try:
-            math.log(eval(self.text.get().replace(',', '')))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.log(value))
-        history = open("history.txt", "a")
-        history.write(f"ln({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.ln, "ln({})")
 
     def log10(self):
-        try:
-            math.log10(eval(self.text.get().replace(',', '')))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.log10(value))
-        history = open("history.txt", "a")
-        history.write(f"log10({value}) = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.log10, "log10({})")
 
     def factorial(self):
-        try:
-            math.factorial(eval(self.text.get().replace(',', '')))
-        except:
-            self.display_error()
-            return 1
-        value = eval(self.text.get().replace(',', ''))
-        self.set_text(math.factorial(value))
-        history = open("history.txt", "a")
-        history.write(f"({value})! = {self.text.get()}\n")
-        history.close()
+        return self.apply(self.engine.factorial, "({})!")
 
     def eVal(self):
+        self.cancel_task()
         self.set_text(math.e)
 
     def piVal(self):
+        self.cancel_task()
         self.set_text(math.pi)
 
     def show_history(self):
-        popup = tk.Tk()
-        popup.title("History")
-        popup.geometry("420x720")
-        popup.minsize(420, 720)
-        popup.maxsize(1024, 720)
-        popup.configure(bg="#000000")
-        popup.focus_force()
-        v = tk.Scrollbar(popup)
-        h = tk.Scrollbar(popup, orient="horizontal")
-        v.pack(side="right", fill="y")
-        h.pack(side="bottom", fill="x")
-        history = open("history.txt", "r")
-        historySize = os.path.getsize("history.txt")
-        text = ("There is no history yet.\n\nTip:\nYou can copy numbers " +
-                "from here\nand paste them into the app's\nanswer field.")
-        clearButton = tk.Button(popup, text="🗑", height=1, font=("Arial", 18), bg="#FF9500", fg="#FFFFFF",
-                                activebackground="#FF9500", activeforeground="#FFFFFF", bd=0,
-                                command=lambda: [open("history.txt", "w").close(), textBox.delete("1.0", tk.END),
-                                textBox.insert(tk.END, "There is no history yet.\n\nTip:\nYou can copy numbers " +
-                                               "from here\nand paste them into the app's\nanswer field."),
-                                                 clearButton.destroy()])
-        if historySize != 0:
-            text = history.read()[:-1]
-            clearButton.pack(side="bottom", anchor="e", padx=10, pady=5)
-        history.close()
-        textBox = tk.Text(popup, height=21, bg="#000000", fg="#FFFFFF", insertbackground="#FFFFFF",
-                          selectbackground="#505050", bd=0, font=("Arial", 18), wrap="none", spacing3=3,
-                          yscrollcommand=v.set)
-        textBox.pack(anchor="w", padx=10, pady=10)
-        textBox.insert(tk.END, text)
-
-        h.config(command=textBox.xview)
-        v.config(command=textBox.yview)
-        textBox.yview(tk.END)
-        popup.mainloop()
+        if self.historyWindow is None:
+            self.historyWindow = HistoryWindow(self, historyStore)
+        self.historyWindow.show()
 
     def plot_graph(self):
         errTitle = "Graph Plotter Error"
@@ -1171,7 +3583,7 @@ class Calculator(tk.Frame, UpdateNumber):
                 m = -1
             else:
                 try:
-                    m = round(eval(valBeforeX), 2)
+                    m = round(evaluator.evaluate(valBeforeX), 2)
                 except (SyntaxError, NameError, TypeError, ZeroDivisionError):
                     tk.messagebox.showinfo(errTitle, expoSlopeErrMsg)
                     return 1
@@ -1190,7 +3602,7 @@ class Calculator(tk.Frame, UpdateNumber):
                     c = 0
                 else:
                     try:
-                        c = round(eval(valAfterX), 2)
+                        c = round(evaluator.evaluate(valAfterX), 2)
                     except (SyntaxError, NameError, TypeError, ZeroDivisionError):
                         # if the expression contains exponent (back split contains "^"), split again based on "+" and "-",
                         # then eval expo
@@ -1200,7 +3612,7 @@ class Calculator(tk.Frame, UpdateNumber):
                         if valBeforeOp == "":
                             try:
                                 if valAfterX.split("-")[1][1:]:
-                                    valBeforeOp = str(eval(valAfterX.split("-")[1][1:]) * -1)
+                                    valBeforeOp = str(evaluator.evaluate(valAfterX.split("-")[1][1:]) * -1)
                                 else:
                                     tk.messagebox.showinfo(errTitle, intErrMsg)
                                     return 1
@@ -1208,7 +3620,7 @@ class Calculator(tk.Frame, UpdateNumber):
                                 tk.messagebox.showinfo(errTitle, expoSlopeErrMsg)
                                 return 1
                         try:
-                            valBeforeOp = round(eval(valBeforeOp), 2)
+                            valBeforeOp = round(evaluator.evaluate(valBeforeOp), 2)
                         except (SyntaxError, NameError, TypeError, ZeroDivisionError):
                             tk.messagebox.showinfo(errTitle, expoSlopeErrMsg)
                             return 1
@@ -1221,13 +3633,13 @@ class Calculator(tk.Frame, UpdateNumber):
                         else:
                             try:
                                 try:
-                                    valAfterOp = eval(valAfterX.split("+")[1])
+                                    valAfterOp = evaluator.evaluate(valAfterX.split("+")[1])
                                 except (SyntaxError, NameError, TypeError):
                                     tk.messagebox.showinfo(errTitle, exponentInterceptErrMsg)
                                     return 1
                             except IndexError:
                                 try:
-                                    valAfterOp = eval(valAfterX.split("-")[1]) * -1
+                                    valAfterOp = evaluator.evaluate(valAfterX.split("-")[1]) * -1
                                 except (SyntaxError, NameError, TypeError):
                                     tk.messagebox.showinfo(errTitle, exponentInterceptErrMsg)
                                     return 1
@@ -1586,9 +3998,9 @@ class CurrencyConverter(tk.Frame, UpdateNumber):
         Frame.set_header_text(self, "Currency Converter")
         SelectionButton.summon(self, controller)
 
-        self.__c = CurrencyRates()
-        self.__b = BtcConverter()
         self.__value = 0
+        self.task = None
+        self.retries = 3
         self.__fromCurrency = tk.StringVar(value="BTC")
         self.__toCurrency = tk.StringVar(value="USD")
 
@@ -1607,6 +4019,7 @@ class CurrencyConverter(tk.Frame, UpdateNumber):
         AnswerField.negative(self)
 
     def clear(self):
+        self.cancel_task()
         self.ratesDetail.config(text="")
         AnswerField.clear(self)
 
@@ -1614,54 +4027,81 @@ class CurrencyConverter(tk.Frame, UpdateNumber):
         AnswerField.delete(self)
 
     def equal(self):
-        # Check for internet connection
-        url = "https://api.coindesk.com/"
-        timeout = 5
+        missing = missing_modules("requests")
+        if missing:
+            self.display_error()
+            self.ratesDetail.config(text=f"Missing module: {', '.join(missing)}\n" +
+                                    f"Install with: pip install {' '.join(missing)}")
+            return 1
+        self.__value = AnswerField.get_value(self)
+        if self.__value is None or self.__value < 0:
+            self.display_error()
+            return 1
+        fromCurrency, toCurrency = self.__fromCurrency.get(), self.__toCurrency.get()
+        self.cancel_task()
+        entry = rateTable.lookup(fromCurrency, toCurrency)
+        if entry is None:
+            return self.start_task(self.__value, fromCurrency, toCurrency, 1)
+        return self.show_rate(self.__value, fromCurrency, toCurrency, *entry)
+
+    def start_task(self, value, fromCurrency, toCurrency, attempt):
+        """
+        Look up the rate on networkExecutor and show "Fetching rates..."
+        until poll_task, polled with after(), gets the result, so a slow
+        network never blocks mainloop.
+        """
+        self.cancel_task()
+        self.task = networkExecutor.submit(rateTable.get_rate, fromCurrency, toCurrency, rateProvider.fetch_rates)
+        self.ratesDetail.config(text="Fetching rates...")
+        self.after(50, self.poll_task, self.task, value, fromCurrency, toCurrency, attempt)
+
+    def poll_task(self, task, value, fromCurrency, toCurrency, attempt):
+        if task is not self.task:  # cancelled
+            return None
+        if not task.done():
+            self.after(50, self.poll_task, task, value, fromCurrency, toCurrency, attempt)
+            return None
+        self.task = None
+        self.ratesDetail.config(text="")
         try:
-            request = requests.get(url, timeout=timeout)
+            rate, fetchedAt = task.result()
         except (requests.ConnectionError, requests.Timeout):
+            if attempt >= self.retries:
+                tk.messagebox.showerror("CalcLab Error", "An error occurred:\nNo internet connection\n\n" +
+                                        "Check your connection and try again later.")
+                self.display_error()
+                return 1
             answer = tk.messagebox.askretrycancel("CalcLab Error", "An error occurred:\nNo internet connection\n\n" +
                                                   "Check your connection and try again.")
-            self.equal() if answer else self.display_error()
+            if answer:
+                self.start_task(value, fromCurrency, toCurrency, attempt + 1)
+            else:
+                self.display_error()
             return 1
-        self.__value = AnswerField.get_value(self)
-        if self.__value is None or self.__value < 0:
+        except (RatesNotAvailableError, ZeroDivisionError):
+            rate = math.nan
+        except:
             self.display_error()
-        else:
-            if self.__fromCurrency.get() == "BTC" or self.__toCurrency.get() == "BTC":
-                try:
-                    float(self.__value)
-                except (DecimalFloatMismatchError, TypeError):
-                    self.display_error()
-                try:
-                    self.__b.convert_btc_to_cur(self.__value, self.__toCurrency.get())
-                except RatesNotAvailableError:
-                    self.text.delete(0, tk.END)
-                    self.text.insert(0, "Rates Not Available")
-                    return 1
-                if self.__fromCurrency.get() == "BTC":
-                    self.ratesDetail.config(text=f"1 BTC = {(self.__b.get_latest_price(self.__toCurrency.get())):,.9f} " +
-                                            f"{self.__toCurrency.get()}" +
-                                            f"\nUpdated {datetime.today().strftime('%d/%m/%Y %I:%M %p')}")
-                    self.__value = self.__b.convert_btc_to_cur(self.__value, self.__toCurrency.get())
+            return 1
+        return self.show_rate(value, fromCurrency, toCurrency, rate, fetchedAt)
 
-                else:
-                    self.ratesDetail.config(text=f"1 {self.__fromCurrency.get()} = " +
-                                            f"{(self.__b.convert_to_btc(self.__value, self.__fromCurrency.get())):,.12f} BTC" +
-                                            f"\nUpdated {datetime.today().strftime('%d/%m/%Y %I:%M %p')}")
-                    self.__value = self.__b.convert_to_btc(self.__value, self.__fromCurrency.get())
-            else:
-                try:
-                    self.__c.convert(self.__fromCurrency.get(), self.__toCurrency.get(), self.__value)
-                except RatesNotAvailableError:
-                    self.text.delete(0, tk.END)
-                    self.text.insert(0, "Rates Not Available")
-                    return 1
-                self.__value = self.__c.convert(self.__fromCurrency.get(), self.__toCurrency.get(), self.__value)
-                self.ratesDetail.config(text=f"1 {self.__fromCurrency.get()} = " +
-                                        f"{(self.__c.get_rate(self.__fromCurrency.get(), self.__toCurrency.get())):,.7f} " +
-                                        f"{self.__toCurrency.get()}\nUpdated {datetime.today().strftime('%d/%m/%Y %I:%M %p')}")
-            self.set_text(round(self.__value, 7))
+    def show_rate(self, value, fromCurrency, toCurrency, rate, fetchedAt):
+        if math.isnan(rate):
+            self.text.delete(0, tk.END)
+            self.text.insert(0, "Rates Not Available")
+            return 1
+        precision = 9 if fromCurrency == "BTC" else 12 if toCurrency == "BTC" else 7
+        self.ratesDetail.config(text=f"1 {fromCurrency} = {rate:,.{precision}f} {toCurrency}\n" +
+                                format_age(fetchedAt))
+        self.__value = value * rate
+        self.set_text(round(self.__value, 7))
+
+    def cancel_task(self):
+        """Stop waiting for the rate. A fetch already running still finishes and fills rateTable."""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.ratesDetail.config(text="")
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -1707,7 +4147,8 @@ class VolumeConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * volume[self.__fromUnitVal.get()] / volume[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["volume"].convert(self.__value, self.__fromUnitVal.get(),
+                                                               self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -1753,7 +4194,8 @@ class LengthConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * length[self.__fromUnitVal.get()] / length[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["length"].convert(self.__value, self.__fromUnitVal.get(),
+                                                               self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -1799,7 +4241,8 @@ class WeightAndMassConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * weightMass[self.__fromUnitVal.get()] / weightMass[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["weightMass"].convert(self.__value, self.__fromUnitVal.get(),
+                                                                   self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -1842,28 +4285,14 @@ class TemperatureConverter(tk.Frame, UpdateNumber):
 
     def equal(self):
         self.__value = AnswerField.get_value(self)
-        if self.__value is None or (self.__value < 0 and self.__fromUnitVal.get() == "Kelvin"):
-            self.display_error()
-        else:
-            if self.__fromUnitVal.get() != self.__toUnitVal.get():
-                if self.__fromUnitVal.get() == "Celsius":
-                    if self.__toUnitVal.get() == "Fahrenheit":
-                        self.set_text((self.__value * 9 / 5) + 32)
-                    else:
-                        self.display_error() if self.__value + 273.15 < 0 else self.set_text(self.__value + 273.15)
-                elif self.__fromUnitVal.get() == "Fahrenheit":
-                    if self.__toUnitVal.get() == "Celsius":
-                        self.set_text((self.__value - 32) * 5 / 9)
-                    else:
-                        self.set_text(((self.__value - 32) * 5 / 9) + 273.15)
-                elif self.__fromUnitVal.get() == "Kelvin":
-                    if self.__toUnitVal.get() == "Celsius":
-                        self.set_text(self.__value - 273.15)
-                    else:
-                        self.display_error() if (self.__value - 273.15) * (9 / 5) + 32 < 0 else self.set_text((
-                                                 self.__value - 273.15) * (9 / 5) + 32)
-            else:
-                self.set_text(self.__value)
+        fromUnit, toUnit = self.__fromUnitVal.get(), self.__toUnitVal.get()
+        try:
+            if self.__value is None or temperatureFormulas[fromUnit, "Kelvin"](self.__value) < 0:
+                return self.display_error()
+            result = temperatureFormulas[fromUnit, toUnit](self.__value)
+        except OverflowError:  # integers too large for a float
+            return self.display_error()
+        self.set_text(result)
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -1909,7 +4338,8 @@ class EnergyConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * energy[self.__fromUnitVal.get()] / energy[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["energy"].convert(self.__value, self.__fromUnitVal.get(),
+                                                               self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -1955,7 +4385,8 @@ class AreaConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * area[self.__fromUnitVal.get()] / area[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["area"].convert(self.__value, self.__fromUnitVal.get(),
+                                                             self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -2001,7 +4432,8 @@ class SpeedConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * speed[self.__fromUnitVal.get()] / speed[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["speed"].convert(self.__value, self.__fromUnitVal.get(),
+                                                              self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -2047,7 +4479,8 @@ class TimeConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * time[self.__fromUnitVal.get()] / time[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["time"].convert(self.__value, self.__fromUnitVal.get(),
+                                                             self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -2092,7 +4525,8 @@ class PowerConverter(tk.Frame, UpdateNumber):
         if self.__value is None:
             self.display_error()
         else:
-            self.set_text(self.__value * power[self.__fromUnitVal.get()] / power[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["power"].convert(self.__value, self.__fromUnitVal.get(),
+                                                              self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -2138,7 +4572,8 @@ class DataConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * data[self.__fromUnitVal.get()] / data[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["data"].convert(self.__value, self.__fromUnitVal.get(),
+                                                             self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -2184,7 +4619,8 @@ class PressureConverter(tk.Frame, UpdateNumber):
         if self.__value is None or self.__value < 0:
             self.display_error()
         else:
-            self.set_text(self.__value * pressure[self.__fromUnitVal.get()] / pressure[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["pressure"].convert(self.__value, self.__fromUnitVal.get(),
+                                                                 self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -2229,7 +4665,8 @@ class AngleConverter(tk.Frame, UpdateNumber):
         if self.__value is None:
             self.display_error()
         else:
-            self.set_text(self.__value * angle[self.__fromUnitVal.get()] / angle[self.__toUnitVal.get()])
+            self.set_text(conversionMatrices["angle"].convert(self.__value, self.__fromUnitVal.get(),
+                                                              self.__toUnitVal.get()))
 
     def set_text(self, value):
         AnswerField.set_value(self, value)
@@ -2240,6 +4677,11 @@ class AngleConverter(tk.Frame, UpdateNumber):
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_command_line(sys.argv[1:]))
+    if missing_modules("numpy"):
+        print("CalcLab Error: the 'numpy' module is missing, install it with: pip install numpy", file=sys.stderr)
+        sys.exit(1)
     CalcLab = CalcLab()
     CalcLab.title("CalcLab")
     CalcLab.resizable(width=False, height=False)
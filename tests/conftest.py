@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+
+
+class FakeEntry:
+    """Stands in for the answer field's tk.Entry, so pages run without a display."""
+
+    def __init__(self, text="0"):
+        self.text = text
+
+    def get(self):
+        return self.text
+
+    def delete(self, first, last=None):
+        first = len(self.text) if first == main.tk.END else first
+        last = first + 1 if last is None else len(self.text) if last == main.tk.END else last
+        self.text = self.text[:first] + self.text[last:]
+
+    def insert(self, index, text):
+        index = len(self.text) if index == main.tk.END else index
+        self.text = self.text[:index] + str(text) + self.text[index:]
+
+    def config(self, **options):
+        pass
+
+
+class FakeButton(dict):
+    def config(self, **options):
+        self.update(options)
+
+
+class FakeVar:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
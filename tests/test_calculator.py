@@ -0,0 +1,48 @@
+import math
+import os
+import sys
+from time import perf_counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+
+
+def test_engine_repeats_last_operation():
+    engine = main.CalculatorEngine()
+    engine.set_operator("+", 5)
+    assert engine.equal(2) == 7
+    assert engine.equal(2) == 9
+    assert engine.expression == (7, "+", 2)
+
+
+def test_engine_store_matches_equal():
+    """Calculator computes large operations elsewhere and stores them, which must leave the same state."""
+    engine = main.CalculatorEngine()
+    engine.set_operator("*", 10 ** 5000)
+    left, right = engine.operands(3)
+    engine.store(left, right, engine.operations["*"](left, right))
+    assert engine.value == 3 * 10 ** 5000
+    assert engine.equal(3) == 9 * 10 ** 5000
+
+
+def test_estimate_expensive_exponent():
+    start = perf_counter()
+    assert main.evaluator.estimate("2**((10**10**7)%7)") == math.inf
+    assert perf_counter() - start < 1
+    assert main.evaluator.estimate("2**(10**8%7)") == 8
+
+
+def test_large_factorials():
+    assert main.formatter.format(main.factorials.factorial(10 ** 4)) == "2.846260e+35659"
+    with pytest.raises(OverflowError):
+        main.factorials.factorial(10 ** 20)  # no precision left for the mantissa
+
+
+def test_evaluate_caches_values():
+    evaluator = main.ExpressionEvaluator()
+    value = evaluator.evaluate("3**200000")
+    assert evaluator.evaluate("3**200000") is value
+    assert evaluator.evaluate("3**200,000") is value
@@ -0,0 +1,119 @@
+import math
+import os
+import sys
+from time import monotonic, perf_counter, sleep
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+from conftest import FakeButton, FakeEntry  # noqa: E402
+
+heavy = "(3**200000)*(3**200000)//(3**199999)"  # over the inline budget, runs in a worker
+
+
+@pytest.fixture
+def calculator(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "historyStore", main.HistoryStore(str(tmp_path / "history.db"), archive=None))
+    calculator = main.Calculator.__new__(main.Calculator)
+    calculator.engine = main.CalculatorEngine()
+    calculator.budget = main.EvaluationBudget()
+    calculator.task = None
+    calculator.historyWindow = None
+    calculator._Calculator__pendingText = ""
+    calculator._Calculator__exactResult = None
+    calculator._Calculator__exactText = None
+    calculator._Calculator__lockSecInput = False
+    calculator._Calculator__lockOperatorInput = False
+    calculator.text = FakeEntry()
+    for name in ("dotButton", "plusButton", "minusButton", "multiplyButton", "divideButton"):
+        setattr(calculator, name, FakeButton())
+    calculator.callbacks = []
+    calculator.after = lambda delay, function, *args: calculator.callbacks.append((function, args))
+    yield calculator
+    calculator.cancel_task()
+    main.historyStore.close()
+
+
+def run_callbacks(calculator, timeout=30):
+    """Run after() callbacks like mainloop would, returning the longest one in seconds."""
+    longest = 0
+    deadline = monotonic() + timeout
+    while calculator.callbacks and monotonic() < deadline:
+        function, args = calculator.callbacks.pop(0)
+        start = perf_counter()
+        function(*args)
+        longest = max(longest, perf_counter() - start)
+        sleep(0.01)
+    return longest
+
+
+def test_worker_result_is_not_evaluated_again(calculator, monkeypatch):
+    calculator.text.text = heavy
+    calculator.equal()
+    assert calculator.task is not None
+    assert calculator.text.get() == "Calculating..."
+
+    def evaluate(text):
+        raise AssertionError(f"{text} evaluated on the Tk thread")
+
+    monkeypatch.setattr(main.evaluator, "evaluate", evaluate)
+    run_callbacks(calculator)
+    assert calculator.task is None
+    assert calculator.text.get() == main.formatter.format(3 ** 200001)
+
+
+@pytest.mark.parametrize("action", ["eVal", "piVal", "negative", "delete", "clear"])
+def test_input_cancels_pending_calculation(calculator, action):
+    calculator.text.text = heavy
+    calculator.equal()
+    assert calculator.task is not None
+    getattr(calculator, action)()
+    shown = calculator.text.get()
+    assert calculator.task is None
+    assert "Calculating" not in shown
+    run_callbacks(calculator)
+    assert calculator.text.get() == shown  # the late result is dropped
+
+
+def test_pi_after_pending_calculation(calculator):
+    calculator.text.text = heavy
+    calculator.equal()
+    calculator.piVal()
+    run_callbacks(calculator)
+    assert calculator.text.get() == main.formatter.format(math.pi)
+
+
+@pytest.mark.parametrize("n", [100, 1001])
+def test_factorial_history_and_copy_are_exact(calculator, n):
+    calculator.text.text = str(n)
+    calculator.factorial()
+    run_callbacks(calculator)
+    assert "e+" in calculator.text.get()
+    digits = str(math.factorial(n))
+    assert main.historyStore.recent(1)[0]["text"] == f"({n})! = {digits}"
+    clipboard = []
+    calculator.clipboard_clear = clipboard.clear
+    calculator.clipboard_append = clipboard.append
+    assert calculator.copy_exact(None) == "break"
+    assert clipboard == [digits]
+
+
+def test_large_product_history_is_exact(calculator):
+    calculator.text.text = str(10 ** 20)
+    calculator.set_operator("*", FakeButton())
+    calculator.text.text = str(10 ** 20 + 1)
+    calculator.equal()
+    run_callbacks(calculator)
+    assert main.historyStore.recent(1)[0]["result"] == str(10 ** 40 + 10 ** 20)
+
+
+def test_unary_operation_evaluates_input_once(calculator, monkeypatch):
+    calls = []
+    evaluate = main.evaluator.evaluate
+    monkeypatch.setattr(main.evaluator, "evaluate", lambda text: calls.append(text) or evaluate(text))
+    calculator.text.text = "2+7"
+    calculator.sqrt()
+    assert calculator.text.get() == "3"
+    assert calls == ["2+7"]
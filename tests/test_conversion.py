@@ -0,0 +1,147 @@
+import array
+import math
+import multiprocessing
+import os
+import sys
+
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+
+
+def test_convert_matches_factors():
+    values = numpy.array([0.0, 1.0, 2.5, 1e6])
+    expected = values * main.length["Miles"] / main.length["Meters"]
+    assert main.convert(values, "Miles", "Meters", "length") == pytest.approx(expected)
+    assert main.convert(values, "Miles", "Meters", main.length) == pytest.approx(expected)
+    buffer = array.array("d", values)
+    assert main.convert(buffer, "Miles", "Meters", "length") == pytest.approx(expected)
+
+
+def test_convert_into_out():
+    values = numpy.array([1.0, 2.0, 3.0])
+    out = numpy.empty(3)
+    assert main.convert(values, "Kilometers", "Meters", "length", out=out) is out
+    assert out.tolist() == [1000.0, 2000.0, 3000.0]
+    buffer = array.array("d", [1.0, 2.0])
+    main.convert(buffer, "Kilometers", "Meters", "length", out=buffer)  # in place, through the buffer
+    assert buffer.tolist() == [1000.0, 2000.0]
+
+
+def test_convert_temperature():
+    values = numpy.array([-40.0, 0.0, 100.0])
+    assert main.convert(values, "Celsius", "Fahrenheit", "temperature").tolist() == [-40.0, 32.0, 212.0]
+    out = numpy.empty(3)
+    assert main.convert(values, "Celsius", "Kelvin", "temperature", out=out) is out
+    assert out == pytest.approx([233.15, 273.15, 373.15])
+
+
+def test_conversion_matrix_factors():
+    matrix = main.ConversionMatrix(main.length)
+    assert matrix.units == list(main.length)
+    assert numpy.diag(matrix.factors) == pytest.approx(numpy.ones(len(main.length)))
+    for fromUnit, toUnit in (("Miles", "Inches"), ("Inches", "Miles"), ("Feet", "Meters")):
+        expected = main.length[fromUnit] / main.length[toUnit]
+        assert matrix.factor(fromUnit, toUnit) == pytest.approx(expected)
+        assert matrix.convert(2.0, fromUnit, toUnit) == pytest.approx(2 * expected)
+        assert matrix.factor(fromUnit, toUnit) * matrix.factor(toUnit, fromUnit) == pytest.approx(1)
+
+
+def test_conversion_matrix_convert_all():
+    matrix = main.ConversionMatrix(main.length)
+    single = matrix.convert_all(3.0, "Feet")
+    assert single == pytest.approx([3 * main.length["Feet"] / main.length[unit] for unit in matrix.units])
+    rows = matrix.convert_all(numpy.array([1.0, 3.0]), "Feet")
+    assert rows.shape == (2, len(matrix.units))
+    assert rows[1] == pytest.approx(single)
+
+
+def test_conversion_matrix_convert_indexed():
+    matrix = main.ConversionMatrix(main.length)
+    pairs = [("Miles", "Meters"), ("Meters", "Miles"), ("Inches", "Feet")]
+    values = numpy.array([1.0, 2.0, 24.0])
+    fromIndex = numpy.array([matrix.index[fromUnit] for fromUnit, _ in pairs])
+    toIndex = numpy.array([matrix.index[toUnit] for _, toUnit in pairs])
+    expected = [value * main.length[fromUnit] / main.length[toUnit] for value, (fromUnit, toUnit) in zip(values, pairs)]
+    assert matrix.convert_indexed(values, fromIndex, toIndex) == pytest.approx(expected)
+    matrix.convert_indexed(values, fromIndex, toIndex, out=values)
+    assert values == pytest.approx(expected)
+
+
+def test_conversion_matrices_compiled_once():
+    matrices = main.ConversionMatrices()
+    assert "area" not in matrices
+    matrix = matrices["area"]
+    assert matrices["area"] is matrix
+    assert matrix.units == list(main.area)
+    with pytest.raises(KeyError):
+        matrices["temperature"]
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with multiprocessing.get_context().Pool(2) as pool:
+        yield pool
+
+
+def test_parallel_convert_matches_convert(pool):
+    values = numpy.linspace(0, 1000, 1001)
+    result = main.parallel_convert(values, "Miles", "Meters", "length", pool=pool)
+    assert result == pytest.approx(main.convert(values, "Miles", "Meters", "length"))
+    assert values[-1] == 1000  # the input is left alone
+
+
+def test_parallel_convert_invalid_values_are_nan(pool):
+    result = main.parallel_convert([-1.0, 0.0, 2.0], "Meters", "Feet", "length", pool=pool)
+    assert math.isnan(result[0])
+    assert result[1:] == pytest.approx([0.0, 2 / main.length["Feet"]])
+    result = main.parallel_convert([-300.0, -273.15, 0.0], "Celsius", "Kelvin", "temperature", pool=pool)
+    assert math.isnan(result[0])
+    assert result[1:] == pytest.approx([0.0, 273.15])
+    result = main.parallel_convert([-180.0, 90.0], "Degrees", "Radians", "angle", pool=pool)
+    assert result == pytest.approx([-180 / main.angle["Radians"], 90 / main.angle["Radians"]])
+
+
+def test_parallel_convert_clamp(pool):
+    result = main.parallel_convert([-5.0, 0.5, 1.0, 5.0], "Meters", "Centimeters", "length", pool=pool,
+                                   clamp=(10.0, 200.0))
+    assert math.isnan(result[0])  # invalid values stay NaN
+    assert result[1:].tolist() == [50.0, 100.0, 200.0]
+
+
+def test_parallel_convert_shared_array_in_place(pool):
+    with main.SharedArray((5,)) as shared:
+        shared.array[...] = [1.0, 2.0, 3.0, 4.0, -1.0]
+        result = main.parallel_convert(shared, "Kilometers", "Meters", "length", pool=pool)
+        assert result is shared.array
+        assert shared.array[:4].tolist() == [1000.0, 2000.0, 3000.0, 4000.0]
+        assert math.isnan(shared.array[4])
+        out = numpy.zeros(5)
+        assert main.parallel_convert(shared, "Meters", "Kilometers", "length", pool=pool, out=out) is out
+        assert out[:4] == pytest.approx([1.0, 2.0, 3.0, 4.0])
+        assert shared.array[:4] == pytest.approx([1.0, 2.0, 3.0, 4.0])  # converted in place as well
+
+
+def test_parallel_convert_into_out(pool):
+    values = numpy.arange(10, dtype=numpy.float64)
+    out = numpy.empty(10)
+    assert main.parallel_convert(values, "Kilometers", "Meters", "length", pool=pool, out=out) is out
+    assert out.tolist() == [value * 1000 for value in range(10)]
+    assert values.tolist() == list(range(10))
+
+
+def test_parallel_convert_own_pool():
+    result = main.parallel_convert(numpy.ones(7), "Kilometers", "Meters", "length", processes=3)
+    assert result.tolist() == [1000.0] * 7
+
+
+def test_convert_shared_chunk():
+    with main.SharedArray((6,)) as shared:
+        shared.array[...] = [1.0, -1.0, 2.0, 3.0, -2.0, 4.0]
+        main.convert_shared_chunk(shared.memory.name, 6, 1, 4, "Meters", "Centimeters", "length", (0.0, 250.0))
+        assert shared.array[0] == 1.0 and shared.array[4:].tolist() == [-2.0, 4.0]  # outside the chunk
+        assert math.isnan(shared.array[1])
+        assert shared.array[2:4].tolist() == [200.0, 250.0]
@@ -0,0 +1,110 @@
+import io
+import os
+import sys
+
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+from conftest import FakeButton, FakeEntry, FakeVar  # noqa: E402
+
+
+def convert_text(text, *args, **kwargs):
+    output = io.StringIO()
+    count = main.convert_csv(io.StringIO(text), output, *args, **kwargs)
+    return count, output.getvalue()
+
+
+def test_convert_csv_columns_by_index():
+    count, text = convert_text("1,a,2\n3,b,x\n", "length", "Meters", "Centimeters", columns=(0, 2))
+    assert count == 2
+    assert text == "100.0,a,200.0\n300.0,b,x\n"
+
+
+def test_convert_csv_columns_by_name():
+    count, text = convert_text("name,m\na,1.5\n", "length", "Meters", "Centimeters", columns=("m",), header=True)
+    assert count == 1
+    assert text == "name,m\na,150.0\n"
+
+
+def test_convert_csv_in_chunks():
+    rows = "".join(f"{i}\n" for i in range(10))
+    count, text = convert_text(rows, "length", "Meters", "Millimeters", chunkSize=3)
+    assert count == 10
+    assert text.split() == [f"{i * 1000.0}" for i in range(10)]
+
+
+def test_convert_csv_temperature_below_absolute_zero():
+    _, text = convert_text("-300\n0\n", "temperature", "Celsius", "Fahrenheit")
+    assert text == "Error\n32.0\n"
+
+
+@pytest.mark.parametrize("columns, header, message", [(("b",), False, "needs a header"),
+                                                      ((-1,), False, "not a column index"),
+                                                      (("missing",), True, "no column named")])
+def test_convert_csv_rejects_bad_columns(columns, header, message):
+    output = io.StringIO()
+    with pytest.raises(ValueError, match=message):
+        main.convert_csv(io.StringIO("a,b\n1,2\n"), output, "length", "Meters", "Feet", columns, header=header)
+    assert output.getvalue() == ""  # nothing written before the error
+
+
+@pytest.mark.parametrize("columns", ["b", "0"])
+def test_convert_command_rejects_bad_columns(tmp_path, capsys, columns):
+    path = tmp_path / "values.csv"
+    path.write_text("1,2\n")
+    assert main.run_command_line(["convert", "length", "Meters", "Feet", "-i", str(path), "-c", columns]) == 1
+    assert "CalcLab Error" in capsys.readouterr().err
+
+
+def test_convert_command_missing_input(tmp_path, capsys):
+    assert main.run_command_line(["convert", "length", "Meters", "Feet", "-i", str(tmp_path / "missing.csv")]) == 1
+    assert "CalcLab Error" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_convert_binary(tmp_path, dtype):
+    values = numpy.arange(10, dtype=dtype)
+    source, target = tmp_path / "values.bin", tmp_path / "converted.bin"
+    values.tofile(source)
+    assert main.convert_binary(str(source), str(target), "length", "Meters", "Centimeters", dtype, chunkSize=3) == 10
+    assert numpy.fromfile(target, dtype=dtype) == pytest.approx(values * 100)
+    assert numpy.fromfile(source, dtype=dtype) == pytest.approx(values)
+
+
+def test_convert_binary_in_place_and_empty(tmp_path):
+    path = tmp_path / "values.bin"
+    numpy.array([1.0, 2.0]).tofile(path)
+    assert main.convert_binary(str(path), None, "length", "Meters", "Centimeters") == 2
+    assert numpy.fromfile(path).tolist() == [100.0, 200.0]
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    assert main.convert_binary(str(empty), str(tmp_path / "out.bin"), "length", "Meters", "Feet") == 0
+    assert (tmp_path / "out.bin").read_bytes() == b""
+
+
+def make_temperature_converter(text, fromUnit, toUnit):
+    converter = main.TemperatureConverter.__new__(main.TemperatureConverter)
+    converter.text = FakeEntry(text)
+    converter.dotButton = FakeButton()
+    converter.after = lambda delay, function, *args: None
+    converter._TemperatureConverter__value = 0
+    converter._TemperatureConverter__fromUnitVal = FakeVar(fromUnit)
+    converter._TemperatureConverter__toUnitVal = FakeVar(toUnit)
+    return converter
+
+
+@pytest.mark.parametrize("value", ["-500", "-100", "0", "37.5", "250", "1000"])
+@pytest.mark.parametrize("fromUnit", ["Celsius", "Fahrenheit", "Kelvin"])
+@pytest.mark.parametrize("toUnit", ["Celsius", "Fahrenheit", "Kelvin"])
+def test_temperature_converter_matches_command_line(value, fromUnit, toUnit):
+    converter = make_temperature_converter(value, fromUnit, toUnit)
+    converter.equal()
+    _, text = convert_text(value + "\n", "temperature", fromUnit, toUnit)
+    expected = text.strip()
+    if expected == "Error":
+        assert converter.text.get() == "Error"
+    else:
+        assert main.evaluator.evaluate(converter.text.get()) == pytest.approx(float(expected))
@@ -0,0 +1,111 @@
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+
+
+def test_search_numbers_with_separators(tmp_path):
+    store = main.HistoryStore(str(tmp_path / "history.db"), archive=None)
+    entryId = store.write("*", [1000, 2], 2000, "1,000 * 2 = 2,000")
+    try:
+        for query in ("2000", "2,000", "contains 2,000", "between 1,999 and 2,001", "1,000"):
+            assert [row["id"] for row in store.search(query)] == [entryId], query
+        assert [row["id"] for row in store.search("= 2,000")] == [entryId]
+    finally:
+        store.close()
+
+
+def test_typed_columns(tmp_path):
+    store = main.HistoryStore(str(tmp_path / "history.db"), archive=None)
+    try:
+        store.write("expression", ["2+3"], 5, "2+3 = 5")
+        store.write("*", [10 ** 20, 10 ** 20 + 1], 10 ** 40 + 10 ** 20, "10^20 * (10^20 + 1)")
+        store.write("!", [1001], main.factorials.factorial(1001), "(1001)! = ...")
+        store.write("sqrt", [2], math.sqrt(2), "sqrt(2) = 1.4142135624")
+        store.flush()
+        rows = store.query("SELECT operands, result, resultValue FROM history ORDER BY id")
+        assert [tuple(row) for row in rows] == [
+            ('["2+3"]', "5", 5.0),
+            (f'["{10 ** 20}", "{10 ** 20 + 1}"]', str(10 ** 40 + 10 ** 20), 1e40),
+            ('["1001"]', str(math.factorial(1001)), None),
+            ('["2"]', repr(math.sqrt(2)), math.sqrt(2)),
+        ]
+        operands = store.query("SELECT value, id FROM historyOperands ORDER BY id, value")
+        assert [tuple(row) for row in operands] == [(1e20, 2), (1e20 + 1, 2), (1001.0, 3), (2.0, 4)]
+        assert [row["id"] for row in store.search("between 1 and 10")] == [4, 1]
+        assert [row["id"] for row in store.search("contains 1.4142")] == [4]
+        assert [row["id"] for row in store.search("contains 1e20")] == [2]
+        store.clear()
+        assert store.query("SELECT COUNT(*) FROM historyOperands")[0][0] == 0
+    finally:
+        store.close()
+
+
+def test_ids_and_archives_after_clear(tmp_path):
+    archive = tmp_path / "history_archive"
+    store = main.HistoryStore(str(tmp_path / "history.db"), maxRows=2, archive=str(archive), segmentSize=2)
+    for value in range(4):
+        store.write("+", [value, 1], value + 1, f"{value} + 1 = {value + 1}")
+    store.flush()
+    store.compact()  # the background thread may have compacted some already
+    assert store.count() == 2
+    store.clear()
+    store.close()
+
+    store = main.HistoryStore(str(tmp_path / "history.db"), maxRows=2, archive=str(archive), segmentSize=2,
+                              maxArchives=1)
+    try:
+        for value in range(4):
+            assert store.write("-", [value, 1], value - 1, f"{value} - 1 = {value - 1}") > 4
+        store.flush()
+        store.compact()  # the background thread may have compacted some already
+        assert store.count() == 2
+        assert sorted(os.listdir(archive)) == ["history-000000000005-000000000006.jsonl.gz"]
+    finally:
+        store.close()
+
+
+def test_upgrade_keeps_rows(tmp_path):
+    path = str(tmp_path / "history.db")
+    connection = main.sqlite3.connect(path)
+    connection.execute("CREATE TABLE history (id INTEGER PRIMARY KEY, time REAL NOT NULL, operation TEXT NOT NULL, "
+                       "operands TEXT NOT NULL, result TEXT NOT NULL, text TEXT NOT NULL)")
+    connection.execute("INSERT INTO history VALUES (7, 1.0, 'sqrt', '[\"9\"]', '3', 'sqrt(9) = 3')")
+    connection.commit()
+    connection.close()
+    store = main.HistoryStore(path, archive=None)
+    try:
+        assert [tuple(row) for row in store.search("sqrt")] == [(7, "sqrt(9) = 3")]
+        assert [row["id"] for row in store.search("contains 9")] == [7]
+        assert [row["id"] for row in store.search("between 2 and 4")] == [7]
+        store.clear()
+        assert store.write("+", [1, 1], 2, "1 + 1 = 2") == 8
+    finally:
+        store.close()
+
+
+def wait_for_count(store, count, timeout=10):
+    deadline = main.monotonic() + timeout
+    while store.count() != count and main.monotonic() < deadline:
+        main.sleep(0.01)
+    return store.count()
+
+
+def test_compaction_on_open_and_on_timer(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = main.HistoryStore(path, maxRows=None, archive=None)
+    for value in range(4):
+        store.write("+", [value, 1], value + 1, f"{value} + 1 = {value + 1}")
+    store.close()
+
+    store = main.HistoryStore(path, maxRows=2, archive=None, compactInterval=0.2)
+    try:
+        store.open()
+        assert wait_for_count(store, 2) == 2  # compacted on open, nothing written
+        store.maxRows = 1
+        assert wait_for_count(store, 1) == 1  # and again on the timer
+    finally:
+        store.close()
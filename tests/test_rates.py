@@ -0,0 +1,150 @@
+import concurrent.futures
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+
+
+def make_table():
+    return main.RateTable(main.currency, main.RateCache(path=None))
+
+
+def test_fixed_provider_rates():
+    table = make_table()
+    provider = main.FixedRateProvider()
+    rate, _ = table.get_rate("USD", "EUR", provider.fetch_rates)
+    assert rate == pytest.approx(main.rateFixtures["EUR"])
+    rate, _ = table.get_rate("EUR", "USD", provider.fetch_rates)
+    assert rate == pytest.approx(1 / main.rateFixtures["EUR"])
+    assert provider.fetches == 1
+
+
+@pytest.fixture
+def server():
+    server = main.RateServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_rate_server_base_currency(server):
+    """The server leaves the base currency out of its rates, which must still be 1."""
+    table = make_table()
+    provider = main.LiveRateProvider(main.RateClient(server.ratesUrl, server.bitcoinUrl))
+    for fromCurrency, toCurrency in (("USD", "EUR"), ("EUR", "USD"), ("BTC", "USD"), ("EUR", "GBP")):
+        rate, _ = table.get_rate(fromCurrency, toCurrency, provider.fetch_rates)
+        expected = main.rateFixtures[toCurrency] / main.rateFixtures[fromCurrency]
+        assert not math.isnan(rate)
+        assert rate == pytest.approx(expected)
+    assert table.refreshes == 1
+
+
+def test_rate_server_without_bitcoin(server):
+    """A failed BTC price leaves only BTC unavailable."""
+    table = make_table()
+    client = main.RateClient(server.ratesUrl, server.bitcoinUrl.replace("/v1/bpi/", "/missing/"), retries=0)
+    provider = main.LiveRateProvider(client)
+    rate, _ = table.get_rate("USD", "EUR", provider.fetch_rates)
+    assert rate == pytest.approx(main.rateFixtures["EUR"])
+    rate, _ = table.get_rate("BTC", "USD", provider.fetch_rates)
+    assert math.isnan(rate)
+    assert table.refreshes == 1
+
+
+def test_concurrent_rate_lookups(tmp_path):
+    """Network threads share the cache and the table, and its snapshot file."""
+    cache = main.RateCache(ttl=600, maxSize=8, path=str(tmp_path / "rates.json"))
+    table = main.RateTable(main.currency, main.RateCache(path=str(tmp_path / "table.json")))
+    provider = main.FixedRateProvider()
+    pairs = [(fromCurrency, toCurrency) for fromCurrency in main.currency[:8] for toCurrency in main.currency[8:16]]
+
+    def fetch(base, target):
+        return provider.fetch_rates(base)[target]
+
+    def work(pair):
+        cache.get_rate(*pair, fetch)
+        return table.get_rate(*pair, provider.fetch_rates)[0]
+
+    with concurrent.futures.ThreadPoolExecutor(16) as executor:
+        rates = list(executor.map(work, pairs * 4))
+    assert rates == pytest.approx([main.rateFixtures[toCurrency] / main.rateFixtures[fromCurrency]
+                                   for fromCurrency, toCurrency in pairs * 4])
+    assert table.refreshes == 1
+    assert len(cache.rates) <= 8
+
+
+def test_rate_history_from_rate_server(server, tmp_path):
+    history = main.RateHistory(str(tmp_path / "rates_history"))
+    provider = main.LiveRateProvider(main.RateClient(server.ratesUrl, server.bitcoinUrl))
+    end = main.datetime(2024, 6, 30).date()
+    assert history.refresh(provider, end, days=3) == 3
+    assert len(history) == 3
+    for fromCurrency, toCurrency in (("USD", "EUR"), ("EUR", "USD"), ("EUR", "GBP"), ("BTC", "USD")):
+        expected = main.rateFixtures[toCurrency] / main.rateFixtures[fromCurrency]
+        assert history.get_rate(fromCurrency, toCurrency, end) == pytest.approx(expected)
+    amounts = history.convert([100.0, 100.0], ["USD", "EUR"], ["EUR", "USD"], [end, end])
+    assert amounts == pytest.approx([100 * main.rateFixtures["EUR"], 100 / main.rateFixtures["EUR"]])
+    assert history.refresh(provider, end) == 0
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = main.SingleFlight()
+    started = main.threading.Event()
+    release = main.threading.Event()
+    calls = []
+
+    def fetch(base):
+        calls.append(base)
+        started.set()
+        release.wait(10)
+        return {base: 1.0}
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        owner = executor.submit(flight.do, "USD", fetch, "USD")
+        assert started.wait(10)
+        waiters = [executor.submit(flight.do, "USD", fetch, "USD") for _ in range(3)]
+        while flight.coalesced < 3:
+            main.sleep(0.001)
+        release.set()
+        results = [future.result() for future in [owner] + waiters]
+    assert calls == ["USD"]
+    assert all(result == {"USD": 1.0} for result in results)
+    assert flight.stats() == {"started": 1, "coalesced": 3, "hitRate": 0.75}
+    assert flight.do("USD", fetch, "USD") == {"USD": 1.0}  # nothing in flight, called again
+    assert calls == ["USD", "USD"]
+
+
+def test_single_flight_shares_exceptions():
+    flight = main.SingleFlight()
+    started = main.threading.Event()
+    release = main.threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(10)
+        raise main.RatesNotAvailableError("no rates")
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        owner = executor.submit(flight.do, "EUR", fail)
+        assert started.wait(10)
+        waiter = executor.submit(flight.do, "EUR", fail)
+        while flight.coalesced < 1:
+            main.sleep(0.001)
+        release.set()
+        for future in (owner, waiter):
+            with pytest.raises(main.RatesNotAvailableError):
+                future.result()
+    assert flight.calls == {}
+    assert flight.do("EUR", lambda: 2) == 2
+
+
+def test_single_flight_keys_are_independent():
+    flight = main.SingleFlight()
+    assert flight.do("USD", lambda: 1) == 1
+    assert flight.do("EUR", lambda: flight.do("USD", lambda: 2)) == 2  # another key does not wait
+    assert flight.stats()["coalesced"] == 0